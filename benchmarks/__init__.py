@@ -0,0 +1,4 @@
+"""
+Performance benchmarks for ImaGen, in the format used by airspeed
+velocity (asv).  See README.rst in this directory.
+"""
@@ -0,0 +1,70 @@
+"""
+Benchmarks for the color conversions of imagen.colorspaces.
+"""
+
+from imagen.colorspaces import ColorSpace, ColorConverter
+
+from .common import sizes, dtypes, unavailable, rate, random_array
+
+
+class Conversions(object):
+    """
+    ColorSpace.convert between RGB and the HSV, LMS and XYZ color
+    spaces.  (Converting an LCH image modifies it in place, so LCH is
+    only covered by Pipeline.)
+    """
+
+    params = [['rgb-hsv','hsv-rgb','rgb-lms','lms-rgb','rgb-xyz','xyz-rgb'],sizes,dtypes]
+    param_names = ['conversion','size','dtype']
+
+    def setup(self,conversion,size,dtype):
+        self.from_,self.to = conversion.split('-')
+        self.colorspace = ColorSpace(dtype=dtype)
+        self.image = random_array((size,size,3),dtype)
+        self.pixels = size*size
+        try:
+            self.convert()
+        except Exception as e:
+            raise unavailable(conversion,e)
+
+    def convert(self):
+        self.colorspace.convert(self.from_,self.to,self.image)
+
+    def time_convert(self,*args):
+        self.convert()
+
+    def peakmem_convert(self,*args):
+        self.convert()
+
+    def track_megapixels_per_second(self,*args):
+        return rate(self.convert)*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
+
+
+
+class Pipeline(object):
+    """
+    ColorConverter taking an image to the analysis space and back, as
+    done when rotating its hue.
+    """
+
+    params = [['HSV','LCH'],sizes]
+    param_names = ['analysis_space','size']
+
+    def setup(self,analysis_space,size):
+        self.converter = ColorConverter(analysis_space=analysis_space)
+        self.image = random_array((size,size,3),'float32')
+        try:
+            self.round_trip()
+        except Exception as e:
+            raise unavailable(analysis_space,e)
+
+    def round_trip(self):
+        c = self.converter
+        c.analysis2working(c.working2analysis(c.image2working(self.image)))
+
+    def time_round_trip(self,*args):
+        self.round_trip()
+
+    def peakmem_round_trip(self,*args):
+        self.round_trip()
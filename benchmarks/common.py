@@ -0,0 +1,68 @@
+"""
+Settings and utilities shared by the benchmarks.
+"""
+
+import importlib
+import time
+
+import numpy as np
+import param
+
+# Number of samples along each side of the (square) sheet
+sizes = [64,256,1024]
+
+dtypes = ['float32','float64']
+
+
+def concrete_classes(base,*modules):
+    """
+    Return a dictionary of the concrete subclasses of base defined in
+    the named modules, by name.  The modules are imported first,
+    skipping any that cannot be (e.g. for lack of an optional
+    dependency).
+    """
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    return dict((name,cls) for name,cls in param.concrete_descendents(base).items()
+                if cls.__module__ in modules)
+
+
+def unavailable(name,error):
+    """
+    Return the exception with which a benchmark's setup reports that
+    it cannot be run here (e.g. for lack of an optional dependency or
+    a data file), so that asv skips it rather than failing.
+    """
+    return NotImplementedError("%s cannot be run: %r" % (name,error))
+
+
+def rate(fn,min_time=0.2,repeat=3):
+    """
+    Return the number of calls of fn per second, from the best of
+    repeat timings of enough calls to take at least min_time seconds.
+    """
+    number = 1
+    while True:
+        start = time.time()
+        for i in range(number):
+            fn()
+        elapsed = time.time()-start
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    best = elapsed
+    for i in range(repeat-1):
+        start = time.time()
+        for j in range(number):
+            fn()
+        best = min(best,time.time()-start)
+    return number/best
+
+
+def random_array(shape,dtype='float64',seed=0):
+    """Return an array of the given shape, uniformly distributed in [0,1)."""
+    return np.random.RandomState(seed).uniform(size=shape).astype(dtype)
@@ -0,0 +1,75 @@
+"""
+Benchmarks for the image samplers and channel transforms of
+imagen.image.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .common import sizes, dtypes, unavailable, rate, random_array
+
+
+class ImageFile(object):
+    """
+    Base class for benchmarks rendering a FileImage of a random RGB
+    image saved to a temporary file, which has the same size as the
+    sheet.
+    """
+
+    def make_image(self,size,**params):
+        try:
+            from imagen.image import FileImage
+        except ImportError as e:
+            raise unavailable('FileImage',e)
+        self.directory = tempfile.mkdtemp()
+        filename = os.path.join(self.directory,'image.npy')
+        np.save(filename,random_array((size,size,3)))
+        self.pixels = size*size
+        try:
+            self.pattern = FileImage(filename=filename,xdensity=size,ydensity=size,**params)
+            self.pattern()
+        except Exception as e:
+            raise unavailable('FileImage',e)
+
+    def teardown(self,*args):
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+    def time_render(self,*args):
+        self.pattern()
+
+    def peakmem_render(self,*args):
+        self.pattern()
+
+    def track_megapixels_per_second(self,*args):
+        return rate(self.pattern)*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
+
+
+
+class ImageSamplers(ImageFile):
+    """Rendering a FileImage using each ImageSampler."""
+
+    params = [['PatternSampler','FastImageSampler'],sizes,dtypes]
+    param_names = ['sampler','size','dtype']
+    timeout = 300
+
+    def setup(self,sampler,size,dtype):
+        import imagen.image
+        self.make_image(size,pattern_sampler=getattr(imagen.image,sampler)(),
+                        dtype=np.dtype(dtype).type)
+
+
+
+class ChannelTransforms(ImageFile):
+    """Rendering the channels of a FileImage through each ChannelTransform."""
+
+    params = [['RotateHue','ScaleChannels'],sizes]
+    param_names = ['transform','size']
+    timeout = 300
+
+    def setup(self,transform,size):
+        import imagen.image
+        self.make_image(size,channel_transforms=[getattr(imagen.image,transform)()])
@@ -0,0 +1,49 @@
+"""
+Benchmarks evaluating the shape functions in imagen.patternfn directly.
+"""
+
+import numpy as np
+
+from imagen import patternfn
+
+from .common import sizes, dtypes, rate
+
+
+# Each function, with arguments following the coordinate matrices
+functions = dict(gaussian=(patternfn.gaussian,(0.3,0.2)),
+                 gabor=(patternfn.gabor,(0.3,0.2,2.0,0.5)),
+                 line=(patternfn.line,(0.2,0.1)),
+                 disk=(patternfn.disk,(0.5,0.1)),
+                 ring=(patternfn.ring,(0.5,0.1,0.1)),
+                 smooth_rectangle=(patternfn.smooth_rectangle,(0.4,0.3,0.1,0.05)))
+
+
+class PatternFunctions(object):
+    """
+    Evaluating each patternfn function on full coordinate matrices,
+    allocating the result ('new') or writing it into an existing
+    array ('out').  The peak memory shows the temporary arrays used.
+    """
+
+    params = [sorted(functions),sizes,dtypes,['new','out']]
+    param_names = ['function','size','dtype','variant']
+
+    def setup(self,name,size,dtype,variant):
+        fn,args = functions[name]
+        coordinates = np.linspace(-0.5,0.5,size).astype(dtype)
+        x,y = np.meshgrid(coordinates,coordinates)
+        # line() takes only the y coordinate
+        coordinates = (y,) if fn is patternfn.line else (x,y)
+        out = np.empty((size,size),dtype) if variant == 'out' else None
+        self.evaluate = lambda: fn(*coordinates+args,out=out)
+        self.pixels = size*size
+
+    def time_evaluate(self,*args):
+        self.evaluate()
+
+    def peakmem_evaluate(self,*args):
+        self.evaluate()
+
+    def track_megapixels_per_second(self,*args):
+        return rate(self.evaluate)*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
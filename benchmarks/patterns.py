@@ -0,0 +1,114 @@
+"""
+Benchmarks rendering every concrete PatternGenerator.
+"""
+
+import numpy as np
+
+import imagen
+from imagen import Disk, PatternGenerator
+from imagen.transferfn import DivisiveNormalizeL1
+
+from .common import sizes, dtypes, concrete_classes, unavailable, rate
+
+generators = concrete_classes(PatternGenerator,'imagen','imagen.patterngenerator',
+                              'imagen.random','imagen.image','imagen.audio')
+
+
+class PatternGenerators(object):
+    """
+    Rendering each PatternGenerator with default parameters, at each
+    size and precision, on its own ('plain'), with an array mask
+    ('mask'), and with an output_fn ('output_fns').
+
+    Generators that cannot be constructed and rendered here (e.g.
+    because they need a data file) are skipped.
+    """
+
+    params = [sorted(generators),sizes,dtypes,['plain','mask','output_fns']]
+    param_names = ['generator','size','dtype','variant']
+    timeout = 300
+
+    def setup(self,name,size,dtype,variant):
+        params = dict(xdensity=size,ydensity=size,dtype=np.dtype(dtype).type)
+        if variant == 'mask':
+            params['mask'] = Disk(size=0.8,smoothing=0.1)(**params)
+        elif variant == 'output_fns':
+            params['output_fns'] = [DivisiveNormalizeL1()]
+        try:
+            self.pattern = generators[name](**params)
+            self.pattern()
+        except Exception as e:
+            raise unavailable(name,e)
+        self.pixels = size*size
+
+    def time_render(self,*args):
+        self.pattern()
+
+    def peakmem_render(self,*args):
+        self.pattern()
+
+    def track_frames_per_second(self,*args):
+        return rate(self.pattern)
+    track_frames_per_second.unit = 'frames/s'
+
+    def track_megapixels_per_second(self,*args):
+        return rate(self.pattern)*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
+
+
+
+class Expressions(object):
+    """
+    Rendering patterns combined using operators, and by Composite
+    with each of its operators.
+    """
+
+    params = [['sum','product','difference','maximum','masked'],sizes,dtypes]
+    param_names = ['expression','size','dtype']
+
+    def setup(self,expression,size,dtype):
+        g = imagen.Gaussian(size=0.2,aspect_ratio=2.0,orientation=0.3)
+        r = imagen.Rectangle(size=0.3,x=0.2)
+        s = imagen.SineGrating(frequency=4.0)
+        d = imagen.Disk(size=0.4,smoothing=0.05)
+        self.pattern = dict(sum=g+r+s, product=g*s, difference=s-g, maximum=g|r|d,
+                            masked=imagen.Composite(generators=[g,r],mask_shape=d))[expression]
+        self.overrides = dict(xdensity=size,ydensity=size,dtype=np.dtype(dtype).type)
+        self.pixels = size*size
+
+    def time_render(self,*args):
+        self.pattern(**self.overrides)
+
+    def peakmem_render(self,*args):
+        self.pattern(**self.overrides)
+
+    def track_megapixels_per_second(self,*args):
+        return rate(lambda: self.pattern(**self.overrides))*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
+
+
+
+class Threads(object):
+    """
+    Rendering large patterns with each number of threads, to show how
+    rendering scales with the number of cores.
+    """
+
+    params = [['Gabor','Composite'],[1,2,4,8]]
+    param_names = ['pattern','threads']
+    timeout = 300
+
+    def setup(self,pattern,threads):
+        g = imagen.Gabor(size=0.3,orientation=0.4)
+        self.pattern = dict(Gabor=g, Composite=imagen.Composite(
+            generators=[g,imagen.Gaussian(size=0.2),imagen.SineGrating(frequency=4.0)],
+            mask_shape=imagen.Disk(size=0.8,smoothing=0.1)))[pattern]
+        self.overrides = dict(xdensity=4096,ydensity=4096,threads=threads)
+        self.pixels = 4096*4096
+
+    def time_render(self,*args):
+        self.pattern(**self.overrides)
+
+    def track_megapixels_per_second(self,*args):
+        return rate(lambda: self.pattern(**self.overrides))*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
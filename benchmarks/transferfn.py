@@ -0,0 +1,45 @@
+"""
+Benchmarks applying each TransferFn in imagen.transferfn to a pattern.
+"""
+
+from imagen.transferfn import TransferFn
+from holoviews.core import BoundingBox, SheetCoordinateSystem
+
+from .common import sizes, dtypes, concrete_classes, unavailable, rate, random_array
+
+transferfns = concrete_classes(TransferFn,'imagen.transferfn','imagen.transferfn.sheet_tf')
+
+
+class TransferFns(object):
+    """
+    Applying each TransferFn in place to a random array.  The same
+    array is transformed on each call.
+    """
+
+    params = [sorted(transferfns),sizes,dtypes]
+    param_names = ['transferfn','size','dtype']
+    timeout = 300
+
+    def setup(self,name,size,dtype):
+        self.array = random_array((size,size),dtype)
+        self.pixels = size*size
+        try:
+            self.fn = transferfns[name]()
+            scs = SheetCoordinateSystem(BoundingBox(radius=0.5),size,size)
+            self.fn.initialize(SCS=scs,shape=scs.shape)
+            self.apply()
+        except Exception as e:
+            raise unavailable(name,e)
+
+    def apply(self):
+        self.fn(self.array)
+
+    def time_apply(self,*args):
+        self.apply()
+
+    def peakmem_apply(self,*args):
+        self.apply()
+
+    def track_megapixels_per_second(self,*args):
+        return rate(self.apply)*self.pixels/1e6
+    track_megapixels_per_second.unit = 'Mpix/s'
@@ -32,6 +32,7 @@ from param import ClassSelector
 from .patterngenerator import PatternGenerator, CompositeBase, Composite
 from .patterngenerator import Constant, ChannelTransform, ChannelGenerator # pyflakes:ignore (API import)
 from .patterngenerator import CorrelateChannels, ComposeChannels # pyflakes:ignore (API import)
+from .profiling import profile, Profile # pyflakes:ignore (API import)
 
 
 from holoviews.element import Image                    # pyflakes:ignore (API import)
@@ -40,8 +41,9 @@ from holoviews.core import SheetCoordinateSystem       # pyflakes:ignore (API im
 from holoviews.core import boundingregion, sheetcoords # pyflakes:ignore (API import)
 
 from .patternfn import gaussian,exponential,gabor,line,disk,ring,\
-    sigmoid,arc_by_radian,arc_by_center,smooth_rectangle,float_error_ignore, \
-    log_gaussian
+    sigmoid,arc_by_radian,arc_by_center,smooth_rectangle, \
+    log_gaussian,gaussian_extent,gaussian_falloff
+from .patternfn import float_error_ignore # pyflakes:ignore (API import)
 
 import numbergen
 from imagen.transferfn import DivisiveNormalizeL1
@@ -61,15 +63,12 @@ class HalfPlane(PatternGenerator):
     smoothing = param.Number(default=0.02,bounds=(0.0,None),softbounds=(0.0,0.5),
                              precedence=0.61,doc="Width of the Gaussian fall-off.")
 
+    _batch_params = ()
+
     def function(self,p):
-        if p.smoothing==0.0:
-            falloff=self.pattern_y*0.0
-        else:
-            with float_error_ignore():
-                falloff=np.exp(np.divide(-self.pattern_y*self.pattern_y,
-                                                2*p.smoothing*p.smoothing))
+        falloff=gaussian_falloff(p.pattern_y,p.smoothing)
 
-        return np.where(self.pattern_y>0.0,1.0,falloff)
+        return np.where(p.pattern_y>0.0,1.0,falloff)
 
 
 class Gaussian(PatternGenerator):
@@ -97,11 +96,29 @@ class Gaussian(PatternGenerator):
         exp(-x^2/(2*xsigma^2) - y^2/(2*ysigma^2)
         where ysigma=size/2 and xsigma=size/2*aspect_ratio.""")
 
+    _batch_params = ()
+    _separable = True
+
+    def _rotationally_symmetric(self,p):
+        return p.aspect_ratio==1.0
+
+    def _support(self,p,threshold=0.0):
+        ysigma = p.size/2.0
+        xsigma = p.aspect_ratio*ysigma
+        return (gaussian_extent(xsigma,threshold,p.dtype),
+                gaussian_extent(ysigma,threshold,p.dtype))
+
     def function(self,p):
         ysigma = p.size/2.0
         xsigma = p.aspect_ratio*ysigma
 
-        return gaussian(self.pattern_x,self.pattern_y,xsigma,ysigma)
+        if p.pattern_x.shape != p.pattern_y.shape:
+            # Separable coordinates: one exponential per row and per
+            # column, rather than one per pixel
+            return (gaussian(p.pattern_x,0.0,xsigma,ysigma)*
+                    gaussian(0.0,p.pattern_y,xsigma,ysigma))
+
+        return gaussian(p.pattern_x,p.pattern_y,xsigma,ysigma)
 
 
 class ExponentialDecay(PatternGenerator):
@@ -127,11 +144,13 @@ class ExponentialDecay(PatternGenerator):
     size = param.Number(default=0.155,doc="""
         Overall scaling of the x and y dimensions.""")
 
+    _batch_params = ()
+
     def function(self,p):
         yscale = p.size/2.0
         xscale = p.aspect_ratio*yscale
 
-        return exponential(self.pattern_x,self.pattern_y,xscale,yscale)
+        return exponential(p.pattern_x,p.pattern_y,xscale,yscale)
 
 
 class SineGrating(PatternGenerator):
@@ -143,9 +162,11 @@ class SineGrating(PatternGenerator):
     phase     = param.Number(default=0.0,bounds=(0.0,None),softbounds=(0.0,2*pi),
                        precedence=0.51,doc="Phase of the sine grating.")
 
+    _batch_params = ('frequency','phase')
+
     def function(self,p):
         """Return a sine grating pattern (two-dimensional sine wave)."""
-        return 0.5 + 0.5*np.sin(p.frequency*2*pi*self.pattern_y + p.phase)
+        return 0.5 + 0.5*np.sin(p.frequency*2*pi*p.pattern_y + p.phase)
 
 
 
@@ -168,11 +189,20 @@ class Gabor(PatternGenerator):
     size = param.Number(default=0.25,doc="""
         Determines the height of the Gaussian component (see Gaussian).""")
 
+    _batch_params = ('frequency','phase')
+
+    def _support(self,p,threshold=0.0):
+        height = p.size/2.0
+        width = p.aspect_ratio*height
+        # The grating is at most 0.5 in magnitude
+        return (gaussian_extent(width,2*threshold,p.dtype),
+                gaussian_extent(height,2*threshold,p.dtype))
+
     def function(self,p):
         height = p.size/2.0
         width = p.aspect_ratio*height
 
-        return gabor(self.pattern_x,self.pattern_y,width,height,
+        return gabor(p.pattern_x,p.pattern_y,width,height,
                      p.frequency,p.phase)
 
 
@@ -206,28 +236,55 @@ class Line(PatternGenerator):
         """Enforce minimum thickness based on the minimum pixel size."""
         return max([p.thickness,self._pixelsize(p)])
 
-    def _count_pixels_on_line(self, y, p):
-        """Count the number of pixels rendered on this line."""
-        h = line(y, self._effective_thickness(p), 0.0)
-        return h.sum()
+    def _count_pixels_on_line(self, offset, p):
+        """
+        Count the number of pixels rendered on this line, with
+        smoothing=0 and the effective thickness, if pattern_y is
+        increased by offset.
+
+        Computed from the pixel coordinates along each axis of the
+        whole matrix, rather than by rendering the line: pattern_y is
+        cos(orientation)*y - sin(orientation)*x (see
+        _create_and_rotate_coordinate_arrays), so in each column the
+        pixels on the line are those whose cos(orientation)*y lies in
+        an interval, and these can be counted by bisection.
+        """
+        x,y = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).sheetcoordinates_of_matrixidx()
+        x,y = np.asarray(x,p.dtype)-p.x, np.asarray(y,p.dtype)-p.y
+        rows = np.sort(np.cos(p.orientation)*y)
+        cols = np.sin(p.orientation)*x - offset
+
+        half_thickness = self._effective_thickness(p)/2.0
+        return (np.searchsorted(rows,cols+half_thickness,'right') -
+                np.searchsorted(rows,cols-half_thickness,'left')).sum()
 
-    def _minimal_y(self, p):
+    def _minimal_offset(self, p):
         """
         For the specified y and one offset by half a pixel, return the
-        one that results in the fewest pixels turned on, so that when
-        the thickness has been enforced to be at least one pixel, no
-        extra pixels are needlessly included (which would cause
-        double-width lines).
+        offset (zero or half a pixel) that results in the fewest pixels
+        turned on, so that when the thickness has been enforced to be
+        at least one pixel, no extra pixels are needlessly included
+        (which would cause double-width lines).
         """
-        y0 = self.pattern_y
-        y1 = y0 + self._pixelsize(p)/2.
-        return y0 if self._count_pixels_on_line(y0, p) < self._count_pixels_on_line(y1, p) else y1
+        offset = self._pixelsize(p)/2.
+        return 0.0 if self._count_pixels_on_line(0.0, p) < self._count_pixels_on_line(offset, p) else offset
+
+    def _support(self,p,threshold=0.0):
+        # The minimal thickness depends on the pixels covered by the
+        # whole line, so the line cannot then be drawn piecewise
+        if p.enforce_minimal_thickness:
+            return None
+        return (np.inf, p.thickness/2.0+gaussian_extent(p.smoothing,threshold,p.dtype))
 
     def function(self,p):
-        return line(
-            self.pattern_y if not p.enforce_minimal_thickness else self._minimal_y(p),
-            p.thickness    if not p.enforce_minimal_thickness else self._effective_thickness(p),
-            p.smoothing)
+        if not p.enforce_minimal_thickness:
+            return line(p.pattern_y, p.thickness, p.smoothing)
+
+        offset = self._minimal_offset(p)
+        if offset == 0.0:
+            return line(p.pattern_y, self._effective_thickness(p), p.smoothing)
+        y = np.add(p.pattern_y, offset)
+        return line(y, self._effective_thickness(p), p.smoothing, out=y)
 
 
 
@@ -254,14 +311,23 @@ class Disk(PatternGenerator):
     smoothing = param.Number(default=0.1,bounds=(0.0,None),softbounds=(0.0,0.5),
                        precedence=0.61,doc="Width of the Gaussian fall-off")
 
+    _batch_params = ('size',)
+
+    def _rotationally_symmetric(self,p):
+        return p.aspect_ratio==1.0
+
+    def _support(self,p,threshold=0.0):
+        radius = p.size/2.0+gaussian_extent(p.smoothing,threshold,p.dtype)
+        return (p.aspect_ratio*radius,radius)
+
     def function(self,p):
         height = p.size
 
         if p.aspect_ratio==0.0:
-            return self.pattern_x*0.0
+            return p.pattern_x*0.0
 
-        return disk(self.pattern_x/p.aspect_ratio,self.pattern_y,height,
-                    p.smoothing)
+        radius = self._setup_radius(p,p.aspect_ratio)
+        return disk(p.pattern_x,p.pattern_y,height,p.smoothing,radius=radius)
 
 
 class Ring(PatternGenerator):
@@ -283,13 +349,23 @@ class Ring(PatternGenerator):
 
     size = param.Number(default=0.5)
 
+    _batch_params = ('size','thickness')
+
+    def _rotationally_symmetric(self,p):
+        return p.aspect_ratio==1.0
+
+    def _support(self,p,threshold=0.0):
+        radius = p.size/2.0+p.thickness/2.0+gaussian_extent(p.smoothing,threshold,p.dtype)
+        return (p.aspect_ratio*radius,radius)
+
     def function(self,p):
         height = p.size
         if p.aspect_ratio==0.0:
-            return self.pattern_x*0.0
+            return p.pattern_x*0.0
 
-        return ring(self.pattern_x/p.aspect_ratio,self.pattern_y,height,
-                    p.thickness,p.smoothing)
+        radius = self._setup_radius(p,p.aspect_ratio)
+        return ring(p.pattern_x,p.pattern_y,height,
+                    p.thickness,p.smoothing,radius=radius)
 
 
 class OrientationContrast(SineGrating):
@@ -315,24 +391,32 @@ class OrientationContrast(SineGrating):
     aspect_ratio   = param.Number(default=1.0,bounds=(0.0,None),softbounds=(0.0,2.0),  doc="Ratio of width to height; size*aspect_ratio gives the overall width.")
     size           = param.Number(default=0.5)
 
-    def __call__(self,**params_to_override):
+    # Drawn by __call__ rather than by SineGrating.function
+    _batch_params = None
+
+    def __call__(self,out=None,**params_to_override):
         p = ParamOverrides(self,params_to_override)
-        input_1=SineGrating(mask_shape=Disk(smoothing=0,size=1.0),phase=p.phase, frequency=p.frequency,
-                            orientation=p.orientationcenter,
-                            scale=p.scalecenter, offset=p.offsetcenter,
-                            x=p.x, y=p.y,size=p.sizecenter)
+        grating,disk_mask,ring_mask = self._child_generators(None,lambda:
+            [SineGrating(),Disk(smoothing=0,size=1.0),Ring(smoothing=0,size=1.0)])
         if p.surround_orientation_relative:
             surround_or = p.orientationcenter + p.orientationsurround
         else:
             surround_or = p.orientationsurround
-        input_2=SineGrating(mask_shape=Ring(thickness=p.thickness,smoothing=0,size=1.0),phase=p.phase, frequency=p.frequency,
-                            orientation=surround_or, scale=p.scalesurround, offset=p.offsetsurround,
-                            x=p.x, y=p.y, size=p.sizesurround)
 
-        patterns = [input_1(xdensity=p.xdensity,ydensity=p.ydensity,bounds=p.bounds),
-                    input_2(xdensity=p.xdensity,ydensity=p.ydensity,bounds=p.bounds)]
-
-        image_array = np.add.reduce(patterns)
+        matrix = dict(xdensity=p.xdensity,ydensity=p.ydensity,dtype=p.dtype,bounds=p.bounds)
+        center_mask = disk_mask(x=p.x,y=p.y,orientation=p.orientationcenter,
+                                size=p.sizecenter,**matrix)
+        surround_mask = ring_mask(thickness=p.thickness,x=p.x,y=p.y,orientation=surround_or,
+                                  size=p.sizesurround,**matrix)
+        input_1 = grating(mask=center_mask,phase=p.phase,frequency=p.frequency,
+                          orientation=p.orientationcenter,
+                          scale=p.scalecenter,offset=p.offsetcenter,
+                          x=p.x,y=p.y,size=p.sizecenter,**matrix)
+        input_2 = grating(mask=surround_mask,phase=p.phase,frequency=p.frequency,
+                          orientation=surround_or,scale=p.scalesurround,offset=p.offsetsurround,
+                          x=p.x,y=p.y,size=p.sizesurround,**matrix)
+
+        image_array = np.add(input_1,input_2,out=out)
         return image_array
 
 
@@ -349,11 +433,17 @@ class RawRectangle(PatternGenerator):
 
     size  = param.Number(default=0.5,doc="Height of the rectangle.")
 
+    _batch_params = ('size','aspect_ratio')
+    _separable = True
+
+    def _support(self,p,threshold=0.0):
+        return (p.aspect_ratio*p.size/2.0,p.size/2.0)
+
     def function(self,p):
         height = p.size
         width = p.aspect_ratio*height
-        return np.bitwise_and(np.abs(self.pattern_x)<=width/2.0,
-                           np.abs(self.pattern_y)<=height/2.0)
+        return np.bitwise_and(np.abs(p.pattern_x)<=width/2.0,
+                           np.abs(p.pattern_y)<=height/2.0)
 
 
 
@@ -372,11 +462,18 @@ class Rectangle(PatternGenerator):
     smoothing = param.Number(default=0.05,bounds=(0.0,None),softbounds=(0.0,0.5),
         precedence=0.61,doc="Width of the Gaussian fall-off outside the rectangle.")
 
+    _batch_params = ('size','aspect_ratio')
+    _separable = True
+
+    def _support(self,p,threshold=0.0):
+        extent = gaussian_extent(p.smoothing,threshold,p.dtype)
+        return (p.aspect_ratio*p.size/2.0+extent,p.size/2.0+extent)
+
     def function(self,p):
         height=p.size
         width=p.aspect_ratio*height
 
-        return smooth_rectangle(self.pattern_x, self.pattern_y,
+        return smooth_rectangle(p.pattern_x, p.pattern_y,
                                 width, height, p.smoothing, p.smoothing)
 
 
@@ -411,10 +508,12 @@ class Arc(PatternGenerator):
 
     def function(self,p):
         if p.aspect_ratio==0.0:
-            return self.pattern_x*0.0
+            return p.pattern_x*0.0
 
-        return arc_by_radian(self.pattern_x/p.aspect_ratio, self.pattern_y, p.size,
-                             (2*pi-p.arc_length, 0.0), p.thickness, p.smoothing)
+        radius,angle = self._setup_radius(p,p.aspect_ratio),self._setup_angle(p,p.aspect_ratio)
+        return arc_by_radian(p.pattern_x, p.pattern_y, p.size,
+                             (2*pi-p.arc_length, 0.0), p.thickness, p.smoothing,
+                             radius=radius, angle=angle)
 
 
 class Curve(Arc):
@@ -463,7 +562,7 @@ class Curve(Arc):
         a concave shape and negative value giving convex.""")
 
     def function(self,p):
-        return arc_by_center(self.pattern_x/p.aspect_ratio,self.pattern_y,
+        return arc_by_center(p.pattern_x/p.aspect_ratio,p.pattern_y,
                              (p.size,p.size*p.curvature),
                              (p.size_type=='constant_length'),
                              p.thickness, p.smoothing)
@@ -489,6 +588,8 @@ class SquareGrating(PatternGenerator):
     # and there might be an easier way to do it than by
     # cropping a sine grating.
 
+    _batch_params = ('frequency','phase','duty_cycle')
+
     def function(self,p):
         """
         Return a square-wave grating (alternating black and white bars).
@@ -496,7 +597,7 @@ class SquareGrating(PatternGenerator):
         return np.around(
             0.5 +
             0.5*np.sin(pi*(p.duty_cycle-0.5)) +
-            0.5*np.sin(p.frequency*2*pi*self.pattern_y + p.phase))
+            0.5*np.sin(p.frequency*2*pi*p.pattern_y + p.phase))
 
 
 #JABALERT: replace with x%1.0 below
@@ -529,19 +630,24 @@ class Selector(CompositeBase):
         random value or other number generator, to allow a different item
         to be selected each time.""")
 
+    _passes_through = True
 
     def function(self,p):
         """Selects and returns one of the patterns in the list."""
         int_index=int(len(p.generators)*wrap(0,1.0,p.index))
         pg=p.generators[int_index]
 
-        image_array = pg(xdensity=p.xdensity,ydensity=p.ydensity,bounds=p.bounds,
-                         x=p.x+p.size*(pg.x*np.cos(p.orientation)-pg.y*np.sin(p.orientation)),
-                         y=p.y+p.size*(pg.x*np.sin(p.orientation)+pg.y*np.cos(p.orientation)),
-                         orientation=pg.orientation+p.orientation,size=pg.size*p.size,
-                         scale=pg.scale*p.scale,offset=pg.offset+p.offset)
+        params = dict(xdensity=p.xdensity,ydensity=p.ydensity,dtype=p.dtype,bounds=p.bounds,
+                      x=p.x+p.size*(pg.x*np.cos(p.orientation)-pg.y*np.sin(p.orientation)),
+                      y=p.y+p.size*(pg.x*np.sin(p.orientation)+pg.y*np.cos(p.orientation)),
+                      orientation=pg.orientation+p.orientation,size=pg.size*p.size,
+                      scale=pg.scale*p.scale,offset=pg.offset+p.offset)
 
-        return image_array
+        # Only the region being rendered, if any (see render_region)
+        window = getattr(p,'_window',None)
+        if window is not None:
+            return pg._render_region(ParamOverrides(pg,params),window)
+        return pg(**params)
 
     def get_current_generator(self):
         """Return the current generator (as specified by self.index)."""
@@ -634,6 +740,10 @@ class Sweeper(ChannelGenerator):
         return self.generator.num_channels()
 
 
+    _windowed = False
+    _passes_through = True
+
+
     def function(self, p):
         motion_time_fn = OffsetTimeFn(offset=p.time_offset,
                                       reset_period=p.reset_period,
@@ -657,14 +767,14 @@ class Sweeper(ChannelGenerator):
                 self._channel_data[i] = pg.channels(
                     x=new_x + p.speed * step * np.cos(motion_orientation),
                     y=new_y + p.speed * step * np.sin(motion_orientation),
-                    xdensity=p.xdensity, ydensity=p.ydensity,
+                    xdensity=p.xdensity, ydensity=p.ydensity, dtype=p.dtype,
                     bounds=p.bounds,
                     orientation=pg.orientation + p.orientation,
                     scale=pg.scale * p.scale, offset=pg.offset + p.offset)[i]
         except AttributeError:
             pass
 
-        image_array = pg(xdensity=p.xdensity, ydensity=p.ydensity,
+        image_array = pg(xdensity=p.xdensity, ydensity=p.ydensity, dtype=p.dtype,
                          bounds=p.bounds,
                          x=new_x + p.speed * step * np.cos(motion_orientation),
                          y=new_y + p.speed * step * np.sin(motion_orientation),
@@ -675,6 +785,15 @@ class Sweeper(ChannelGenerator):
 
 
 
+def _rotated_angle(angle, orientation):
+    """
+    Polar angle, in [-pi,pi), of the points at the given angle in a
+    pattern rotated by orientation.
+    """
+    return np.mod(angle - orientation + pi, 2*pi) - pi
+
+
+
 class Spiral(PatternGenerator):
     """
     Archimedean spiral.
@@ -696,27 +815,23 @@ class Spiral(PatternGenerator):
         precedence=0.62,doc="Density of turnings; turning*angle gives the actual radius.")
 
     def function(self,p):
-        aspect_ratio = p.aspect_ratio
-        x = self.pattern_x/aspect_ratio
-        y = self.pattern_y
-        thickness = p.thickness
-        gaussian_width = p.smoothing
-        turning = p.turning
+        distance_from_origin = self._setup_radius(p,p.aspect_ratio)
+        angle = self._setup_angle(p,p.aspect_ratio)
+        return self._spiral(distance_from_origin,angle,p.thickness,p.smoothing,p.turning)
 
+    @staticmethod
+    def _spiral(distance_from_origin, angle, thickness, gaussian_width, turning):
+        """Spiral at the given polar coordinates (as from _setup_radius and _setup_angle)."""
         spacing = turning*2*pi
 
-        distance_from_origin = np.sqrt(x**2+y**2)
-        distance_from_spiral_middle = np.fmod(spacing + distance_from_origin - turning*np.arctan2(y,x),spacing)
+        distance_from_spiral_middle = np.fmod(spacing + distance_from_origin - turning*angle,spacing)
 
         distance_from_spiral_middle = np.minimum(distance_from_spiral_middle,spacing - distance_from_spiral_middle)
         distance_from_spiral = distance_from_spiral_middle - thickness/2.0
 
-        spiral = 1.0 - np.greater_equal(distance_from_spiral,0.0)
-
-        sigmasq = gaussian_width*gaussian_width
+        spiral = np.logical_not(np.greater_equal(distance_from_spiral,0.0))
 
-        with float_error_ignore():
-            falloff = np.exp(np.divide(-distance_from_spiral*distance_from_spiral, 2.0*sigmasq))
+        falloff = gaussian_falloff(distance_from_spiral, gaussian_width)
 
         return np.maximum(falloff, spiral)
 
@@ -740,12 +855,18 @@ class SpiralGrating(Composite):
         precedence=0.62,doc="Density of turnings; turning*angle gives the actual radius.")
 
 
-    def function(self, p):
-        gens = [Spiral(turning=p.turning,smoothing=p.smoothing,thickness=p.thickness,
-                       orientation=i*2*np.pi/p.parts) for i in range(p.parts)]
+    _centred = True
 
-        return Composite(generators=gens, bounds=p.bounds, orientation=p.orientation,
-                         xdensity=p.xdensity, ydensity=p.ydensity)()
+    def function(self, p):
+        # The maximum of parts Spirals at equally spaced orientations,
+        # all computed from the same polar coordinates
+        distance_from_origin,angle = self._setup_radius(p),self._setup_angle(p)
+        result = None
+        for i in range(p.parts):
+            spiral = Spiral._spiral(distance_from_origin,_rotated_angle(angle,i*2*np.pi/p.parts),
+                                    p.thickness,p.smoothing,p.turning)
+            result = spiral if result is None else np.maximum(result,spiral,out=result)
+        return result
 
 
 
@@ -767,10 +888,12 @@ class HyperbolicGrating(PatternGenerator):
     size = param.Number(default=0.5,bounds=(0.0,None),softbounds=(0.0,2.0),
         precedence=0.62,doc="Size as distance of inner hyperbola vertices from the centre.")
 
+    _batch_params = ('size','thickness')
+
     def function(self,p):
         aspect_ratio = p.aspect_ratio
-        x = self.pattern_x/aspect_ratio
-        y = self.pattern_y
+        x = p.pattern_x/aspect_ratio
+        y = p.pattern_y
         thickness = p.thickness
         gaussian_width = p.smoothing
         size = p.size
@@ -780,12 +903,9 @@ class HyperbolicGrating(PatternGenerator):
 
         distance_from_vertex = distance_from_vertex_middle - thickness/2.0
 
-        hyperbola = 1.0 - np.greater_equal(distance_from_vertex,0.0)
-
-        sigmasq = gaussian_width*gaussian_width
+        hyperbola = np.logical_not(np.greater_equal(distance_from_vertex,0.0))
 
-        with float_error_ignore():
-            falloff = np.exp(np.divide(-distance_from_vertex*distance_from_vertex, 2.0*sigmasq))
+        falloff = gaussian_falloff(distance_from_vertex, gaussian_width)
 
         return np.maximum(falloff, hyperbola)
 
@@ -805,22 +925,22 @@ class Wedge(PatternGenerator):
     smoothing = param.Number(default=0.4,bounds=(0.0,None),softbounds=(0.0,0.5),
         precedence=0.61,doc="Width of the Gaussian fall-off outside the sector.")
 
+    _batch_params = ('size',)
+
     def function(self,p):
-        aspect_ratio = p.aspect_ratio
-        x = self.pattern_x/aspect_ratio
-        y = self.pattern_y
-        gaussian_width = p.smoothing
+        angle = self._setup_angle(p,p.aspect_ratio)
+        return self._wedge(angle,p.size,p.smoothing)
 
-        angle = np.absolute(np.arctan2(y,x))
-        half_length = p.size/2
+    @staticmethod
+    def _wedge(angle, size, gaussian_width):
+        """Wedge at the given polar angles (as from _setup_angle)."""
+        angle = np.absolute(angle)
+        half_length = size/2
 
-        radius = 1.0 - np.greater_equal(angle,half_length)
+        radius = np.logical_not(np.greater_equal(angle,half_length))
         distance = angle - half_length
 
-        sigmasq = gaussian_width*gaussian_width
-
-        with float_error_ignore():
-            falloff = np.exp(np.divide(-distance*distance, 2.0*sigmasq))
+        falloff = gaussian_falloff(distance, gaussian_width)
 
         return np.maximum(radius, falloff)
 
@@ -838,12 +958,31 @@ class RadialGrating(Composite):
         precedence=0.61,doc="""
         Width of the Gaussian fall-off outside the sector, scaled by parts.""")
 
+    _centred = True
+
     def function(self, p):
-        gens = [Wedge(size=1.0/p.parts,smoothing=p.smoothing/p.parts,
-                      orientation=i*2*np.pi/p.parts) for i in range(p.parts)]
+        # The maximum of parts Wedges at equally spaced orientations,
+        # all computed from the same polar coordinates
+        angle = self._setup_angle(p)
+        result = None
+        for i in range(p.parts):
+            wedge = Wedge._wedge(_rotated_angle(angle,i*2*np.pi/p.parts),
+                                 1.0/p.parts,p.smoothing/p.parts)
+            result = wedge if result is None else np.maximum(result,wedge,out=result)
+        return result
+
+
+def _part_params(p, x, y, orientation, **params):
+    """
+    Parameters with which to render one part of a pattern drawn from
+    several generators, with the given position and orientation
+    relative to the pattern, which has the parameters p.  The pattern
+    is centred on the origin, whatever its x and y.
+    """
+    cos,sin = np.cos(p.orientation),np.sin(p.orientation)
+    return dict(params, xdensity=p.xdensity, ydensity=p.ydensity, bounds=p.bounds, dtype=p.dtype,
+                x=x*cos-y*sin, y=x*sin+y*cos, orientation=orientation+p.orientation)
 
-        return Composite(generators=gens, bounds=p.bounds, orientation=p.orientation,
-                         xdensity=p.xdensity, ydensity=p.ydensity)()
 
 
 class Asterisk(Composite):
@@ -864,17 +1003,13 @@ class Asterisk(Composite):
     size = param.Number(default=0.5,bounds=(0.01,None),softbounds=(0.1,2.0),
         precedence=0.62,doc="Overall diameter of the pattern.")
 
-    def function(self, p):
-        o=2*np.pi/p.parts
-        gens = [Rectangle(orientation=i*o,smoothing=p.smoothing,
-                          aspect_ratio=2*p.thickness/p.size,
-                          size=p.size/2,
-                          x=-p.size/4*np.sin(i*o),
-                          y= p.size/4*np.cos(i*o))
-                   for i in range(p.parts)]
+    def _advance_pattern_generators(self, p):
+        return self._child_generators(p.parts,lambda: [Rectangle() for i in range(p.parts)])
 
-        return Composite(generators=gens, bounds=p.bounds, orientation=p.orientation,
-                         xdensity=p.xdensity, ydensity=p.ydensity)()
+    def _child_params(self, p, pg, i):
+        o=i*2*np.pi/p.parts
+        return _part_params(p, -p.size/4*np.sin(o), p.size/4*np.cos(o), o, smoothing=p.smoothing,
+                            aspect_ratio=2*p.thickness/p.size, size=p.size/2)
 
 
 
@@ -895,14 +1030,13 @@ class Angle(Composite):
     angle = param.Number(default=pi/4,bounds=(0.0,None),softbounds=(0,pi),
         precedence=0.63,doc="Angle between the two line segments.")
 
-    def function(self, p):
-        gens=[Rectangle(orientation=i*p.angle,smoothing=p.smoothing,
-                        aspect_ratio=p.thickness/p.size,size=p.size,
-                        x=-p.size/2*np.sin(i*p.angle))
-              for i in [-1,1]]
+    def _advance_pattern_generators(self, p):
+        return self._child_generators(None,lambda: [Rectangle(),Rectangle()])
 
-        return Composite(generators=gens, bounds=p.bounds, orientation=p.orientation,
-                         xdensity=p.xdensity, ydensity=p.ydensity)()
+    def _child_params(self, p, pg, i):
+        angle = (-p.angle,p.angle)[i]
+        return _part_params(p, -p.size/2*np.sin(angle), 0.0, angle,
+                            smoothing=p.smoothing, aspect_ratio=p.thickness/p.size, size=p.size)
 
 
 
@@ -924,27 +1058,26 @@ class ConcentricRings(PatternGenerator):
     size = param.Number(default=0.4,bounds=(0.01,None),softbounds=(0.1,2.0),
         precedence=0.62,doc="Radius difference of neighbouring rings.")
 
+    _batch_params = ('size','thickness')
+
+    def _rotationally_symmetric(self,p):
+        return p.aspect_ratio==1.0
+
     def function(self,p):
-        aspect_ratio = p.aspect_ratio
-        x = self.pattern_x/aspect_ratio
-        y = self.pattern_y
         thickness = p.thickness
         gaussian_width = p.smoothing
         size = p.size
 
-        distance_from_origin = np.sqrt(x**2+y**2)
+        distance_from_origin = self._setup_radius(p,p.aspect_ratio)
 
         distance_from_ring_middle = np.fmod(distance_from_origin,size)
         distance_from_ring_middle = np.minimum(distance_from_ring_middle,size - distance_from_ring_middle)
 
         distance_from_ring = distance_from_ring_middle - thickness/2.0
 
-        ring = 1.0 - np.greater_equal(distance_from_ring,0.0)
+        ring = np.logical_not(np.greater_equal(distance_from_ring,0.0))
 
-        sigmasq = gaussian_width*gaussian_width
-
-        with float_error_ignore():
-            falloff = np.exp(np.divide(-distance_from_ring*distance_from_ring, 2.0*sigmasq))
+        falloff = gaussian_falloff(distance_from_ring, gaussian_width)
 
         return np.maximum(falloff, ring)
 
@@ -963,16 +1096,60 @@ class ArcCentered(Arc):
 
     def function(self,p):
         if p.aspect_ratio==0.0:
-            return self.pattern_x*0.0
-        self.pattern_x -= (1+np.cos(pi-p.arc_length/2))*p.size/4
+            return p.pattern_x*0.0
+        x = p.pattern_x - (1+np.cos(pi-p.arc_length/2))*p.size/4
 
-        return arc_by_radian((self.pattern_x+p.size/2)/p.aspect_ratio, self.pattern_y, p.size,
+        return arc_by_radian((x+p.size/2)/p.aspect_ratio, p.pattern_y, p.size,
                              (2*pi-p.arc_length/2, p.arc_length/2), p.thickness, p.smoothing)
 
 
-class DifferenceOfGaussians(PatternGenerator):
+class DoGBase(PatternGenerator):
+    """
+    Pattern computed from Gaussians, each divided by its sum over the
+    whole matrix (its L1 norm), as for a difference of Gaussians.
+    """
+
+    __abstract = True
+
+    _windowed = False
+    _separable = True
+
+    def _normalized_gaussian(self, p, x, y, orientation, size, aspect_ratio):
+        """
+        Gaussian (as drawn by Gaussian) centred on (x,y) at the given
+        orientation, divided by its sum over the matrix specified by p
+        (i.e. its L1 norm, as for DivisiveNormalizeL1) if that is non-zero.
+
+        The coordinates are the grids set up by _setup_xy, which are
+        shared with any other pattern at the same position and
+        orientation.  On separable grids the Gaussian is the product of a
+        row and a column, and its sum the product of their sums.
+        """
+        pattern_x,pattern_y = self._setup_xy(p.bounds,p.xdensity,p.ydensity,x,y,orientation,p.dtype)
+        ysigma = size/2.0
+        xsigma = aspect_ratio*ysigma
+
+        if pattern_x.shape != pattern_y.shape:
+            x_factor = gaussian(pattern_x,0.0,xsigma,ysigma)
+            y_factor = gaussian(0.0,pattern_y,xsigma,ysigma)
+            total = 1.0*np.sum(x_factor)*np.sum(y_factor)
+            result = x_factor*y_factor
+        else:
+            result = gaussian(pattern_x,pattern_y,xsigma,ysigma)
+            total = 1.0*np.sum(result)
+
+        if total != 0:
+            result *= 1.0/total
+        return result
+
+
+
+class DifferenceOfGaussians(DoGBase):
     """
     Two-dimensional difference of Gaussians pattern.
+
+    Each Gaussian is divided by its sum over the whole matrix (its L1
+    norm) before the negative one is subtracted from the positive one.
     """
 
     positive_size = param.Number(default=0.1, bounds=(0.0,None), softbounds=(0.0,5.0), precedence=(1),
@@ -1002,16 +1179,11 @@ class DifferenceOfGaussians(PatternGenerator):
 
 
     def function(self, p):
-        positive = Gaussian(x=p.positive_x+p.x, y=p.positive_y+p.y,
-            size=p.positive_size*p.size, aspect_ratio=p.positive_aspect_ratio,
-            orientation=p.orientation, output_fns=[DivisiveNormalizeL1()])
-
-        negative = Gaussian(x=p.negative_x+p.x, y=p.negative_y+p.y,
-            size=p.negative_size*p.size, aspect_ratio=p.negative_aspect_ratio,
-            orientation=p.orientation, output_fns=[DivisiveNormalizeL1()])
-
-        return Composite(generators=[positive,negative], operator=np.subtract,
-            xdensity=p.xdensity, ydensity=p.ydensity, bounds=p.bounds)()
+        result = self._normalized_gaussian(p, p.positive_x+p.x, p.positive_y+p.y, p.orientation,
+                                           p.positive_size*p.size, p.positive_aspect_ratio)
+        result -= self._normalized_gaussian(p, p.negative_x+p.x, p.negative_y+p.y, p.orientation,
+                                            p.negative_size*p.size, p.negative_aspect_ratio)
+        return result
 
 
 
@@ -1028,11 +1200,11 @@ class Sigmoid(PatternGenerator):
 
 
     def function(self, p):
-        return sigmoid(self.pattern_y, p.slope)
+        return sigmoid(p.pattern_y, p.slope)
 
 
 
-class SigmoidedDoG(PatternGenerator):
+class SigmoidedDoG(DoGBase):
     """
     Sigmoid multiplicatively combined with a difference of Gaussians,
     such that one part of the plane can be the mirror image of the other.
@@ -1061,14 +1233,19 @@ class SigmoidedDoG(PatternGenerator):
 
 
     def function(self, p):
-        diff_of_gaussians = DifferenceOfGaussians(positive_x=p.x, positive_y=p.y, negative_x=p.x, negative_y=p.y,
-            positive_size=p.positive_size*p.size, positive_aspect_ratio=p.positive_aspect_ratio,
-            negative_size=p.negative_size*p.size, negative_aspect_ratio=p.negative_aspect_ratio)
-
-        sigmoid = Sigmoid(slope=p.sigmoid_slope, orientation=p.orientation+pi/2, x=p.x+p.sigmoid_position)
-
-        return Composite(generators=[diff_of_gaussians, sigmoid], bounds=p.bounds,
-            operator=np.multiply, xdensity=p.xdensity, ydensity=p.ydensity)()
+        # The difference of Gaussians is unrotated, and both Gaussians
+        # are centred on (x,y), so that they share a separable grid
+        result = self._normalized_gaussian(p, p.x, p.y, 0.0,
+                                           p.positive_size*p.size, p.positive_aspect_ratio)
+        result -= self._normalized_gaussian(p, p.x, p.y, 0.0,
+                                            p.negative_size*p.size, p.negative_aspect_ratio)
+
+        # The sigmoid divides the plane along the y axis of the pattern,
+        # through x=sigmoid_position on the sheet (which is where its
+        # axis crosses y=0)
+        axis = (np.cos(p.orientation)*p.sigmoid_position - np.sin(p.orientation)*p.y) - p.pattern_x
+        result *= sigmoid(axis, p.sigmoid_slope)
+        return result
 
 
 
@@ -1094,7 +1271,7 @@ class LogGaussian(PatternGenerator):
         doc="""The length of the tail along the y axis.""")
 
 
-    def __call__(self, **params_to_override):
+    def __call__(self, out=None, **params_to_override):
         """
         Call the subclass's 'function' method on a rotated and scaled
         coordinate system.
@@ -1103,15 +1280,19 @@ class LogGaussian(PatternGenerator):
         called without any params, uses the values for the Parameters
         as currently set on the object. Otherwise, any params
         specified override those currently set on the object.
+        If an array is supplied as out, the pattern is written into it.
         """
         p = ParamOverrides(self, params_to_override)
 
-        self._setup_xy(p)
+        p.pattern_x, p.pattern_y = self._setup_xy(p)
         fn_result = self.function(p)
         self._apply_mask(p, fn_result)
 
         scale_factor = p.scale / np.max(fn_result)
-        result = scale_factor*fn_result + p.offset
+        result = self._scale_into(scale_factor, fn_result, out)
+        result += p.offset
+        if out is None:
+            result = self._as_dtype(result, p.dtype)
 
         for of in p.output_fns:
             of(result)
@@ -1121,15 +1302,16 @@ class LogGaussian(PatternGenerator):
 
     def _setup_xy(self, p):
         """
-        Produce pattern coordinate matrices from the bounds and
-        density (or rows and cols), and transforms them according to
+        Return pattern coordinate matrices produced from the bounds
+        and density (or rows and cols), and transformed according to
         x, y, and orientation.
         """
         self.debug("bounds=%s, xdensity=%s, ydensity=%s, x=%s, y=%s, orientation=%s",p.bounds, p.xdensity, p.ydensity, p.x, p.y, p.orientation)
 
         x_points,y_points = SheetCoordinateSystem(p.bounds, p.xdensity, p.ydensity).sheetcoordinates_of_matrixidx()
+        x_points,y_points = np.asarray(x_points, p.dtype), np.asarray(y_points, p.dtype)
 
-        self.pattern_x, self.pattern_y = self._create_and_rotate_coordinate_arrays(x_points-p.x, y_points-p.y, p)
+        return self._create_and_rotate_coordinate_arrays(x_points-p.x, y_points-p.y, p)
 
 
     def _create_and_rotate_coordinate_arrays(self, x, y, p):
@@ -1156,7 +1338,7 @@ class LogGaussian(PatternGenerator):
 
 
     def function(self, p):
-        return log_gaussian(self.pattern_x, self.pattern_y, p.x_shape, p.y_shape, p.size)
+        return log_gaussian(p.pattern_x, p.pattern_y, p.x_shape, p.y_shape, p.size)
 
 
 
@@ -1210,22 +1392,27 @@ class SigmoidedDoLG(PatternGenerator):
         doc="""X position of the transition between the two regions.""")
 
 
+    _windowed = False
+
+
     def function(self, p):
-        positive = LogGaussian(size=p.positive_size*p.size, aspect_ratio=p.positive_aspect_ratio, x_shape=p.positive_x_shape,
+        positive,negative,sigmoid,normalize = self._child_generators(None,lambda:
+            [LogGaussian(output_fns=[]), LogGaussian(output_fns=[]), Sigmoid(), DivisiveNormalizeL1()])
+        matrix = dict(xdensity=p.xdensity, ydensity=p.ydensity, dtype=p.dtype, bounds=p.bounds)
+
+        result = positive(size=p.positive_size*p.size, aspect_ratio=p.positive_aspect_ratio, x_shape=p.positive_x_shape,
             y_shape=p.positive_y_shape, scale=p.positive_scale*p.scale, orientation=p.orientation, x=p.x, y=p.y,
-            output_fns=[])
+            **matrix)
 
-        negative = LogGaussian(size=p.negative_size*p.size, aspect_ratio=p.negative_aspect_ratio, x_shape=p.negative_x_shape,
+        np.subtract(result, negative(size=p.negative_size*p.size, aspect_ratio=p.negative_aspect_ratio, x_shape=p.negative_x_shape,
             y_shape=p.negative_y_shape, scale=p.negative_scale*p.scale, orientation=p.orientation, x=p.x, y=p.y,
-            output_fns=[])
-
-        diff_of_log_gaussians = Composite(generators=[positive, negative], operator=np.subtract,
-            xdensity=p.xdensity, ydensity=p.ydensity, bounds=p.bounds)
+            **matrix), out=result)
 
-        sigmoid = Sigmoid(x=p.x+p.sigmoid_position, slope=p.sigmoid_slope, orientation=p.orientation+pi/2.0)
+        np.multiply(result, sigmoid(x=p.x+p.sigmoid_position, slope=p.sigmoid_slope, orientation=p.orientation+pi/2.0,
+            **matrix), out=result)
 
-        return Composite(generators=[diff_of_log_gaussians, sigmoid], bounds=p.bounds,
-            operator=np.multiply, xdensity=p.xdensity, ydensity=p.ydensity, output_fns=[DivisiveNormalizeL1()])()
+        normalize(result)
+        return result
 
 
 
@@ -1374,6 +1561,10 @@ class PowerSpectrum(PatternGenerator):
         You may also supply your own.""")
 
 
+    # The pattern is computed as a whole from the signal
+    _windowed = False
+
+
     def __init__(self, **params):
         super(PowerSpectrum, self).__init__(**params)
 
@@ -124,17 +124,17 @@ class TwoRectangles(PatternGenerator):
 
         return np.bitwise_or(
                np.bitwise_and(np.bitwise_and(
-                        (self.pattern_x-p.x1)<=p.x1+width/4.0,
-                        (self.pattern_x-p.x1)>=p.x1-width/4.0),
+                        (p.pattern_x-p.x1)<=p.x1+width/4.0,
+                        (p.pattern_x-p.x1)>=p.x1-width/4.0),
                       np.bitwise_and(
-                        (self.pattern_y-p.y1)<=p.y1+height/4.0,
-                        (self.pattern_y-p.y1)>=p.y1-height/4.0)),
+                        (p.pattern_y-p.y1)<=p.y1+height/4.0,
+                        (p.pattern_y-p.y1)>=p.y1-height/4.0)),
                np.bitwise_and(np.bitwise_and(
-                        (self.pattern_x-p.x2)<=p.x2+width/4.0,
-                        (self.pattern_x-p.x2)>=p.x2-width/4.0),
+                        (p.pattern_x-p.x2)<=p.x2+width/4.0,
+                        (p.pattern_x-p.x2)>=p.x2-width/4.0),
                       np.bitwise_and(
-                        (self.pattern_y-p.y2)<=p.y2+height/4.0,
-                        (self.pattern_y-p.y2)>=p.y2-height/4.0)))
+                        (p.pattern_y-p.y2)<=p.y2+height/4.0,
+                        (p.pattern_y-p.y2)>=p.y2-height/4.0)))
 
 
 ### JABALERT: This class should be eliminated if at all possible; it
@@ -233,6 +233,9 @@ class Translator(PatternGenerator):
     time_fn = param.Callable(default=param.Dynamic.time_fn,doc="""
         Function to generate the time used as a base for translation.""")
 
+    # Episodes start at the time of the previous call, not at fixed times
+    _deterministic = False
+
     def _advance_params(self):
         """
         Explicitly generate new values for these parameters only
@@ -326,6 +329,8 @@ class OldSweeper(PatternGenerator):
     def __set_phase(self,new_val): self.generator.phase = new_val
     phase = property(__get_phase,__set_phase)
 
+    _windowed = False
+
     def function(self,p):
         """Selects and returns one of the patterns in the list."""
         pg = p.generator
@@ -108,7 +108,7 @@ class PatternSampler(ImageSampler):
         # Stores a SheetCoordinateSystem with an activity matrix
         # representing the image
         if not isinstance(image,np.ndarray):
-            image = np.array(image,np.float)
+            image = np.array(image,float)
 
         rows,cols = image.shape
         self.scs = SheetCoordinateSystem(xdensity=1.0,ydensity=1.0,
@@ -249,7 +249,7 @@ class FastImageSampler(ImageSampler):
         # image given the options. (maybe this class needs to be
         # redesigned?  The interface to this function is pretty inscrutable.)
         im = ImageOps.fit(self.image,x.shape,self.sampling_method)
-        return np.array(im,dtype=np.float)
+        return np.array(im,dtype=float)
 
 
 
@@ -332,6 +332,9 @@ class GenericImage(ChannelGenerator):
         return self._channel_data
 
 
+    # The pattern_sampler may normalize the sampled pattern as a whole
+    _windowed = False
+
     def function(self,p):
         height = p.size
         width = p.aspect_ratio*height
@@ -403,7 +406,7 @@ class FileImage(GenericImage):
                            # call after super.__init__, which calls _get_image()
 
 
-    def __call__(self,**params_to_override):
+    def __call__(self,out=None,**params_to_override):
         # Cache image to avoid channel_data being deleted before channel-specific processing completes.
         p = param.ParamOverrides(self,params_to_override)
 
@@ -418,7 +421,9 @@ class FileImage(GenericImage):
             if p.cache_image is False:
                 self._image = None
 
-
+        if out is not None:
+            out[...] = self._cached_average
+            return out
         return self._cached_average
 
 
@@ -4,6 +4,17 @@ Family of two-dimensional functions indexed by x and y.
 All functions are written to be valid both for scalar x and y, and for
 numpy arrays of x and y (in which case the result is also an array);
 the functions therefore have the same mathematical behaviour as numpy.
+Like numpy ufuncs, the functions computing a whole pattern accept an
+array out into which the result is written (in place of allocating a
+new array), which must have the shape of x and y broadcast together.
+
+Many of the functions use Gaussian smoothing, i.e. a calculation like
+exp(-d*d/(2*sigma*sigma)).  A zero sigma is handled explicitly (see
+gaussian_falloff) rather than by dividing by zero, so no function here
+changes numpy's floating-point error handling (see numpy.seterr).
+exp() underflows to zero far from the centre of a Gaussian, which
+numpy ignores unless the caller has asked for underflow to be
+reported.
 """
 
 
@@ -19,36 +30,99 @@ from contextlib import contextmanager
 @contextmanager
 def float_error_ignore():
     """
-    Many of the functions in this module use Gaussian smoothing, which
-    is based on a calculation like exp(divide(x*x,sigma)).  When sigma
-    is zero the value of this expression should be zero at all points
-    in the plane, because such a Gaussian is infinitely small.
-    Obtaining the correct answer using finite-precision floating-point
-    array computations requires allowing infinite values to be
-    returned from divide(), and allowing exp() to underflow silently
-    to zero when given an infinite value.  In numpy this is achieved
-    by using its seterr() function to disable divide-by-zero and
-    underflow warnings temporarily while these values are being
-    computed.
+    Context in which numpy ignores floating-point division by zero
+    and underflow, restoring the previous settings (even if an
+    exception is raised) on leaving it.
+
+    No longer needed by the functions in this module, which avoid
+    dividing by zero; retained for code outside imagen using it.
+    """
+    with np.errstate(divide='ignore',under='ignore'):
+        yield
+
+
+def _output(out, *operands):
+    """
+    Return out if supplied, or else a new array of the shape and type
+    of the result of an elementwise operation on the operands (other
+    than any that are None).  The operands include any parameters that
+    may be arrays, e.g. sizes varying along the first axis of a batch
+    (see PatternGenerator.render_batch).
+    """
+    if out is None:
+        operands = [o for o in operands if o is not None]
+        out = np.empty(np.broadcast(*operands).shape, np.result_type(1.0, *operands))
+    return out
+
+
+def _result(out, result):
     """
-    oldsettings=np.seterr(divide='ignore',under='ignore')
-    yield
-    np.seterr(**oldsettings)
+    Return the result array, or the value it contains if it is
+    zero-dimensional and was not supplied as out (i.e. if the
+    arguments were scalars).
+    """
+    return result[()] if out is None and result.ndim==0 else result
+
+
+def gaussian_falloff(distance, gaussian_width, out=None):
+    """
+    Gaussian fall-off exp(-distance^2/(2*gaussian_width^2)) with the
+    given distance from the edge of a shape.
 
+    A Gaussian of zero width is infinitely small, so the fall-off is
+    then zero everywhere (as it is when the width is so small that its
+    square is zero in floating point).
 
-def gaussian(x, y, xsigma, ysigma):
+    The out array may be distance itself, which is then overwritten.
+    """
+    result = _output(out, distance)
+    sigmasq = gaussian_width*gaussian_width
+    if sigmasq==0.0:
+        result.fill(0.0)
+    else:
+        np.multiply(distance, distance, out=result)
+        result /= -2.0*sigmasq
+        np.exp(result, out=result)
+    return _result(out, result)
+
+
+def gaussian_extent(sigma, threshold=0.0, dtype=np.float64):
+    """
+    Distance from the centre of a Gaussian fall-off of width sigma,
+    i.e. exp(-d*d/(2*sigma*sigma)), beyond which its value is below
+    threshold or, for a threshold of zero, beyond which it underflows
+    to exactly zero in the given floating-point type.
+    """
+    info = np.finfo(dtype)
+    # exp() returns zero below the log of half the smallest
+    # subnormal number; one is added to allow for rounding
+    limit = np.log(2.0) - np.log(info.tiny) - np.log(info.eps) + 1.0
+    if threshold > 0.0:
+        limit = min(limit, -np.log(threshold))
+    return sigma*np.sqrt(2*limit)
+
+
+def gaussian(x, y, xsigma, ysigma, out=None):
     """
     Two-dimensional oriented Gaussian pattern (i.e., 2D version of a
     bell curve, like a normal distribution but not necessarily summing
     to 1.0).
     """
+    result = _output(out, x, y)
     if xsigma==0.0 or ysigma==0.0:
-        return x*0.0
+        result.fill(0.0)
+        return _result(out, result)
 
-    with float_error_ignore():
-        x_w = np.divide(x,xsigma)
-        y_h = np.divide(y,ysigma)
-        return np.exp(-0.5*x_w*x_w + -0.5*y_h*y_h)
+    # exp(-0.5*(x/xsigma)^2 - 0.5*(y/ysigma)^2), computed in result,
+    # using only a temporary of the shape of y
+    np.divide(x, xsigma, out=result)
+    np.multiply(result, result, out=result)
+    result *= -0.5
+    y_h = np.divide(y, ysigma, out=_output(None, y))
+    np.multiply(y_h, y_h, out=y_h)
+    y_h *= -0.5
+    result += y_h
+    return _result(out, np.exp(result, out=result))
 
 
 def log_gaussian(x, y, x_sigma, y_sigma, mu):
@@ -61,11 +135,16 @@ def log_gaussian(x, y, x_sigma, y_sigma, mu):
     if x_sigma==0.0 or y_sigma==0.0:
         return x * 0.0
 
-    with float_error_ignore():
-        x_w = np.divide(np.log(x)-mu, x_sigma*x_sigma)
-        y_h = np.divide(np.log(y)-mu, y_sigma*y_sigma)
+    x_w = np.divide(_log(x)-mu, x_sigma*x_sigma)
+    y_h = np.divide(_log(y)-mu, y_sigma*y_sigma)
+
+    return np.exp(-0.5*x_w*x_w + -0.5*y_h*y_h)
 
-        return np.exp(-0.5*x_w*x_w + -0.5*y_h*y_h)
+
+def _log(x):
+    """Natural logarithm of x, with log(0) = -inf without a division-by-zero error."""
+    x = np.asarray(x, dtype=np.result_type(x, 1.0))
+    return np.log(x, out=np.full(x.shape, -np.inf, x.dtype), where=x!=0)
 
 
 def sigmoid(axis, slope):
@@ -75,8 +154,7 @@ def sigmoid(axis, slope):
 
     At default rotation, axis refers to the vertical (y) axis.
     """
-    with float_error_ignore():
-        return (2.0 / (1.0 + np.exp(-2.0*slope*axis))) - 1.0
+    return (2.0 / (1.0 + np.exp(-2.0*slope*axis))) - 1.0
 
 
 def exponential(x, y, xscale, yscale):
@@ -86,24 +164,24 @@ def exponential(x, y, xscale, yscale):
     if xscale==0.0 or yscale==0.0:
         return x*0.0
 
-    with float_error_ignore():
-        x_w = np.divide(x,xscale)
-        y_h = np.divide(y,yscale)
-        return np.exp(-np.sqrt(x_w*x_w+y_h*y_h))
+    x_w = np.divide(x,xscale)
+    y_h = np.divide(y,yscale)
+    return np.exp(-np.sqrt(x_w*x_w+y_h*y_h))
 
 
-def gabor(x, y, xsigma, ysigma, frequency, phase):
+def gabor(x, y, xsigma, ysigma, frequency, phase, out=None):
     """
     Gabor pattern (sine grating multiplied by a circular Gaussian).
     """
+    result = gaussian(x, y, xsigma, ysigma, out=_output(out, x, y, frequency, phase))
     if xsigma==0.0 or ysigma==0.0:
-        return x*0.0
+        return _result(out, result)
 
-    with float_error_ignore():
-        x_w = np.divide(x,xsigma)
-        y_h = np.divide(y,ysigma)
-        p = np.exp(-0.5*x_w*x_w + -0.5*y_h*y_h)
-    return p * 0.5*np.cos(2*pi*frequency*y + phase)
+    result *= 0.5
+    grating = np.multiply(2*pi*frequency, y, out=_output(None, y, frequency, phase))
+    grating += phase
+    result *= np.cos(grating, out=grating)
+    return _result(out, result)
 
 
 # JABHACKALERT: Shouldn't this use 'size' instead of 'thickness',
@@ -111,152 +189,143 @@ def gabor(x, y, xsigma, ysigma, frequency, phase):
 # size parameter and ignores it, which is very confusing.  I guess
 # it's called thickness to match ring, but matching gaussian and disk
 # is probably more important.
-def line(y, thickness, gaussian_width):
+def line(y, thickness, gaussian_width, out=None):
     """
     Infinite-length line with a solid central region, then Gaussian fall-off at the edges.
     """
-    distance_from_line = abs(y)
-    gaussian_y_coord = distance_from_line - thickness/2.0
-    sigmasq = gaussian_width*gaussian_width
+    # Distance outside the solid region, then the fall-off, in result
+    result = np.abs(y, out=_output(out, y))
+    result -= thickness/2.0
+    on_line = result<=0
 
-    if sigmasq==0.0:
-        falloff = y*0.0
-    else:
-        with float_error_ignore():
-            falloff = np.exp(np.divide(-gaussian_y_coord*gaussian_y_coord,2*sigmasq))
+    gaussian_falloff(result, gaussian_width, out=result)
+    np.copyto(result, 1.0, where=on_line)
+    return _result(out, result)
 
-    return np.where(gaussian_y_coord<=0, 1.0, falloff)
 
+def polar(x, y):
+    """
+    Polar coordinates (radius,angle) of the points (x,y), with the
+    angle in [-pi,pi] measured anticlockwise from the x axis.
 
-def disk(x, y, height, gaussian_width):
+    The functions below that depend on the distance from the origin
+    (or on the angle) accept these as the optional arguments radius
+    (and angle), so that the transform can be computed once and
+    shared between several patterns on the same coordinates.
+    """
+    return np.hypot(x, y), np.arctan2(y, x)
+
+
+def _distance_from_circle(x, y, radius, circle_radius, out):
+    """
+    Compute the signed distance of (x,y) from a circle about the
+    origin in the array out, from the distance radius of each point
+    from the origin (computed from x and y if radius is None).
+    """
+    if radius is None:
+        radius = np.hypot(x, y, out=out)
+    return np.subtract(radius, circle_radius, out=out)
+
+
+def disk(x, y, height, gaussian_width, out=None, radius=None):
     """
     Circular disk with Gaussian fall-off after the solid central region.
+
+    If supplied, radius is the distance of (x,y) from the origin (see
+    polar).
     """
     disk_radius = height/2.0
 
-    distance_from_origin = np.sqrt(x**2+y**2)
-    distance_outside_disk = distance_from_origin - disk_radius
-    sigmasq = gaussian_width*gaussian_width
+    # Distance outside the disk, then the fall-off, in result
+    result = _distance_from_circle(x, y, radius, disk_radius, _output(out, x, y, radius, height))
+    in_disk = result<=0
 
-    if sigmasq==0.0:
-        falloff = x*0.0
-    else:
-        with float_error_ignore():
-            falloff = np.exp(np.divide(-distance_outside_disk*distance_outside_disk,
-                                  2*sigmasq))
+    gaussian_falloff(result, gaussian_width, out=result)
+    np.copyto(result, 1.0, where=in_disk)
+    return _result(out, result)
 
-    return np.where(distance_outside_disk<=0,1.0,falloff)
 
-
-def ring(x, y, height, thickness, gaussian_width):
+def ring(x, y, height, thickness, gaussian_width, out=None, radius=None):
     """
     Circular ring (annulus) with Gaussian fall-off after the solid ring-shaped region.
+
+    If supplied, radius is the distance of (x,y) from the origin (see
+    polar).
     """
-    radius = height/2.0
+    ring_radius = height/2.0
     half_thickness = thickness/2.0
 
-    distance_from_origin = np.sqrt(x**2+y**2)
-    distance_outside_outer_disk = distance_from_origin - radius - half_thickness
-    distance_inside_inner_disk = radius - half_thickness - distance_from_origin
-
-    ring = 1.0-np.bitwise_xor(np.greater_equal(distance_inside_inner_disk,0.0),
-                              np.greater_equal(distance_outside_outer_disk,0.0))
-
-    sigmasq = gaussian_width*gaussian_width
+    # Distance outside the outer disk, then its fall-off, in result,
+    # and distance inside the inner disk, then its fall-off, in inner
+    result = _distance_from_circle(x, y, radius, ring_radius,
+                                   _output(out, x, y, radius, height, thickness))
+    inner = np.negative(result, out=np.empty_like(result))
+    inner -= half_thickness
+    result -= half_thickness
 
-    if sigmasq==0.0:
-        inner_falloff = x*0.0
-        outer_falloff = x*0.0
-    else:
-        with float_error_ignore():
-            inner_falloff = np.exp(np.divide(-distance_inside_inner_disk*distance_inside_inner_disk, 2.0*sigmasq))
-            outer_falloff = np.exp(np.divide(-distance_outside_outer_disk*distance_outside_outer_disk, 2.0*sigmasq))
+    # Points in the ring are either inside both disks or outside both
+    ring = np.equal(inner>=0.0, result>=0.0)
 
-    return np.maximum(inner_falloff,np.maximum(outer_falloff,ring))
+    gaussian_falloff(inner, gaussian_width, out=inner)
+    gaussian_falloff(result, gaussian_width, out=result)
+    np.maximum(result, ring, out=result)
+    np.maximum(inner, result, out=result)
+    return _result(out, result)
 
 
-def smooth_rectangle(x, y, rec_w, rec_h, gaussian_width_x, gaussian_width_y):
+def _band(coordinate, width, gaussian_width, out=None):
     """
-    Rectangle with a solid central region, then Gaussian fall-off at the edges.
+    Band of the given width centred on zero along one coordinate,
+    with Gaussian fall-off at its edges (one factor of
+    smooth_rectangle).
     """
+    result = np.abs(coordinate, out=_output(out, coordinate, width))
+    result -= width/2.0
+    in_band = result<0.0
 
-    gaussian_x_coord = abs(x)-rec_w/2.0
-    gaussian_y_coord = abs(y)-rec_h/2.0
+    gaussian_falloff(result, gaussian_width, out=result)
+    np.maximum(result, in_band, out=result)
+    return result
 
-    box_x=np.less(gaussian_x_coord,0.0)
-    box_y=np.less(gaussian_y_coord,0.0)
-    sigmasq_x=gaussian_width_x*gaussian_width_x
-    sigmasq_y=gaussian_width_y*gaussian_width_y
 
-    with float_error_ignore():
-        falloff_x=x*0.0 if sigmasq_x==0.0 else \
-            np.exp(np.divide(-gaussian_x_coord*gaussian_x_coord,2*sigmasq_x))
-        falloff_y=y*0.0 if sigmasq_y==0.0 else \
-            np.exp(np.divide(-gaussian_y_coord*gaussian_y_coord,2*sigmasq_y))
+def smooth_rectangle(x, y, rec_w, rec_h, gaussian_width_x, gaussian_width_y, out=None):
+    """
+    Rectangle with a solid central region, then Gaussian fall-off at the edges.
+    """
+    # The x and y factors are each computed on their own coordinates,
+    # which are a row and a column if x and y are separable
+    shape = np.broadcast(x, y, rec_w, rec_h).shape
+    band_x = _band(x, rec_w, gaussian_width_x,
+                   out if out is not None and np.broadcast(x, rec_w).shape==shape else None)
+    band_y = _band(y, rec_h, gaussian_width_y)
 
-    return np.minimum(np.maximum(box_x,falloff_x), np.maximum(box_y,falloff_y))
+    result = band_x if out is None and band_x.shape==shape else _output(out, band_x, band_y)
+    return _result(out, np.minimum(band_x, band_y, out=result))
 
 
 
-def arc_by_radian(x, y, height, radian_range, thickness, gaussian_width):
+def arc_by_radian(x, y, height, radian_range, thickness, gaussian_width, radius=None, angle=None):
     """
     Radial arc with Gaussian fall-off after the solid ring-shaped
     region with the given thickness, with shape specified by the
     (start,end) radian_range.
-    """
 
-    # Create a circular ring (copied from the ring function)
-    radius = height/2.0
-    half_thickness = thickness/2.0
-
-    distance_from_origin = np.sqrt(x**2+y**2)
-    distance_outside_outer_disk = distance_from_origin - radius - half_thickness
-    distance_inside_inner_disk = radius - half_thickness - distance_from_origin
-
-    ring = 1.0-np.bitwise_xor(np.greater_equal(distance_inside_inner_disk,0.0),
-                              np.greater_equal(distance_outside_outer_disk,0.0))
-
-    sigmasq = gaussian_width*gaussian_width
+    The range is measured clockwise from the x axis, from 0 to 2*pi
+    (with points on the positive x axis at 2*pi).  If supplied, radius
+    and angle are the polar coordinates of (x,y) (see polar).
+    """
+    if radius is None or angle is None:
+        radius, angle = polar(x, y)
+    output_ring = ring(x, y, height, thickness, gaussian_width, radius=radius)
 
-    if sigmasq==0.0:
-        inner_falloff = x*0.0
-        outer_falloff = x*0.0
-    else:
-        with float_error_ignore():
-            inner_falloff = np.exp(np.divide(-distance_inside_inner_disk*distance_inside_inner_disk, 2.0*sigmasq))
-            outer_falloff = np.exp(np.divide(-distance_outside_outer_disk*distance_outside_outer_disk, 2.0*sigmasq))
-
-    output_ring = np.maximum(inner_falloff,np.maximum(outer_falloff,ring))
-
-    # Calculate radians (in 4 phases) and cut according to the set range)
-
-    # RZHACKALERT:
-    # Function float_error_ignore() cannot catch the exception when
-    # both np.dividend and divisor are 0.0, and when only divisor is 0.0
-    # it returns 'Inf' rather than 0.0. In x, y and
-    # distance_from_origin, only one point in distance_from_origin can
-    # be 0.0 (circle center) and in this point x and y must be 0.0 as
-    # well. So here is a hack to avoid the 'invalid value encountered
-    # in divide' error by turning 0.0 to 1e-5 in distance_from_origin.
-    distance_from_origin += np.where(distance_from_origin == 0.0, 1e-5, 0)
-
-    with float_error_ignore():
-        sines = np.divide(y, distance_from_origin)
-        cosines = np.divide(x, distance_from_origin)
-        arcsines = np.arcsin(sines)
-
-    phase_1 = np.where(np.logical_and(sines >= 0, cosines >= 0), 2*pi-arcsines, 0)
-    phase_2 = np.where(np.logical_and(sines >= 0, cosines <  0), pi+arcsines,   0)
-    phase_3 = np.where(np.logical_and(sines <  0, cosines <  0), pi+arcsines,   0)
-    phase_4 = np.where(np.logical_and(sines <  0, cosines >= 0), -arcsines,     0)
-    arcsines = phase_1 + phase_2 + phase_3 + phase_4
+    # Clockwise angle, from the anticlockwise one in [-pi,pi]
+    clockwise = np.where(angle >= 0, 2*pi - angle, -angle)
 
     if radian_range[0] <= radian_range[1]:
-        return np.where(np.logical_and(arcsines >= radian_range[0], arcsines <= radian_range[1]),
-                        output_ring, 0.0)
+        in_range = np.logical_and(clockwise >= radian_range[0], clockwise <= radian_range[1])
     else:
-        return np.where(np.logical_or(arcsines >= radian_range[0], arcsines <= radian_range[1]),
-                        output_ring, 0.0)
+        in_range = np.logical_or(clockwise >= radian_range[0], clockwise <= radian_range[1])
+    return np.where(in_range, output_ring, 0.0)
 
 
 def arc_by_center(x, y, arc_box, constant_length, thickness, gaussian_width):
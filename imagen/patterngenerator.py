@@ -11,14 +11,20 @@ more information.
 import numpy as np
 from numpy import pi
 import collections
+import hashlib
+import inspect
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
 
 import param
+import numbergen
 from param.parameterized import ParamOverrides
 
 from holoviews import HoloMap, Image, RGB, Dimension
 from holoviews.core import BoundingBox, BoundingRegionParameter, SheetCoordinateSystem
 
-from .transferfn import TransferFn
+from .transferfn import TransferFn, TransferFnWithState
 
 
 # CEBALERT: PatternGenerator has become a bit of a monster abstract
@@ -31,6 +37,297 @@ from .transferfn import TransferFn
 # them be used like the current ones.
 # (PatternGenerator-->TwoDPatternGenerator?)
 
+class ArrayCache(param.Parameterized):
+    """
+    Least-recently-used cache of read-only arrays.
+
+    Entries are tuples of arrays stored under a hashable key.  The
+    arrays are marked read-only before being cached, because the same
+    objects are handed out to every caller that looks up the same key.
+    The total size of the cached arrays is kept below max_bytes by
+    discarding the least recently used entries.
+    """
+
+    max_bytes = param.Integer(default=64*2**20,bounds=(0,None),doc="""
+        Upper bound on the total number of bytes held by the cache.
+        Set to zero to disable caching altogether.""")
+
+    def __init__(self,**params):
+        super(ArrayCache,self).__init__(**params)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def lookup(self,key,create):
+        """
+        Return the tuple of arrays stored under key, calling create()
+        to construct (and cache) it if it is not already present.
+        """
+        with self._lock:
+            arrays = self._entries.pop(key,None)
+            if arrays is not None:
+                self._entries[key] = arrays
+                self.hits += 1
+                return arrays
+            self.misses += 1
+
+        arrays = tuple(create())
+        nbytes = sum(a.nbytes for a in arrays)
+        if nbytes > self.max_bytes:
+            return arrays
+
+        for a in arrays:
+            a.flags.writeable = False
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = arrays
+                self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _,discarded = self._entries.popitem(last=False)
+                self.nbytes -= sum(a.nbytes for a in discarded)
+        return arrays
+
+
+    def clear(self):
+        """Discard all entries and reset the hit and miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+
+# Shared by all PatternGenerators: the rotated coordinate grids built
+# by _setup_xy, keyed on everything that determines them.
+coordinate_cache = ArrayCache(name='coordinate_cache')
+
+# Patterns rendered by PatternGenerators with memoize=True, keyed on
+# the resolved values of all their parameters.
+result_cache = ArrayCache(name='result_cache')
+
+
+class _Unmemoizable(Exception):
+    """Raised by _memo_key for values that cannot be part of a key."""
+
+
+def _memo_key(value,timed=False,digest=True):
+    """
+    Return a hashable key equal for any two values that would render
+    the same pattern, or raise _Unmemoizable if there is no such key.
+
+    Arrays are keyed on a digest of their contents (or only on their
+    identity, if digest is False, which suffices to find out whether
+    there is a key), Parameterized objects on their class and the
+    resolved values of their parameters, and time functions on the
+    current time.  TransferFnWithState objects (e.g. Hysteresis) have
+    no key, since their output depends on their earlier calls.
+
+    If timed is True, objects that are otherwise not deterministic
+    (see _memo_parameters) are accepted if they are time_dependent,
+    i.e. if their values are determined by the current time.  The key
+    then identifies the pattern for the current time only.
+    """
+    if value is None or isinstance(value,(bool,int,float,complex,str,np.generic)):
+        return value
+    elif isinstance(value,np.ndarray):
+        if value.dtype.hasobject:
+            raise _Unmemoizable
+        if not digest:
+            return ('array',id(value))
+        return ('array',value.dtype.str,value.shape,
+                hashlib.sha1(np.ascontiguousarray(value).data).hexdigest())
+    elif isinstance(value,(list,tuple)):
+        return (type(value).__name__,)+tuple(_memo_key(v,timed,digest) for v in value)
+    elif isinstance(value,dict):
+        return ('dict',)+tuple(sorted((k,_memo_key(v,timed,digest)) for k,v in value.items()))
+    elif isinstance(value,BoundingBox):
+        return ('BoundingBox',)+tuple(value.lbrt())
+    elif isinstance(value,param.Time):
+        return ('time',value())
+    elif isinstance(value,(numbergen.NumberGenerator,TransferFnWithState)):
+        raise _Unmemoizable
+    elif isinstance(value,param.Parameterized):
+        return _memo_parameters(value,{},timed,digest)
+    try:
+        hash(value)
+    except TypeError:
+        raise _Unmemoizable
+    return value
+
+
+def _memo_parameters(obj,overrides,timed=False,digest=True):
+    """
+    Return a key for the Parameterized obj with the given parameter
+    overrides, as for _memo_key.
+
+    A Dynamic parameter is keyed on its current value only if reading
+    it again returns the same value, because its generator is a
+    function of time or the parameter only draws a new value when the
+    time changes; otherwise reading it would draw a new value.  With
+    timed, only the former is accepted, since the value drawn at a
+    later time then depends on the values drawn before.  Objects whose
+    _deterministic attribute is False (e.g. RandomGenerators) cannot
+    be keyed at all.
+    """
+    if not (getattr(obj,'_deterministic',True) or
+            (timed and getattr(obj,'time_dependent',False))):
+        raise _Unmemoizable
+    # Only the explicit overrides (newer versions of ParamOverrides
+    # report every parameter of obj as contained in it)
+    overrides = dict(overrides)
+    items = []
+    for name,parameter in sorted(obj.params().items()):
+        # Composite parameters (e.g. position) just combine others
+        if name == 'name' or isinstance(parameter,param.Composite):
+            continue
+        if name in overrides:
+            value = overrides[name]
+        else:
+            generator = obj.get_value_generator(name)
+            if hasattr(generator,'_Dynamic_last'):
+                time_fn = getattr(generator,'_Dynamic_time_fn',parameter.time_fn)
+                repeated = parameter.time_dependent and time_fn is not None
+                if not (getattr(generator,'time_dependent',False) or
+                        (repeated and not timed)):
+                    raise _Unmemoizable
+            value = getattr(obj,name)
+        items.append((name,_memo_key(value,timed,digest)))
+    return (type(obj),)+tuple(items)
+
+
+# The generator and time function being animated by
+# PatternGenerator.anim, inherited by forked worker processes
+_anim_state = None
+
+def _anim_frames(times):
+    """Render the frames of _anim_state at the given times, in order."""
+    pg, time_fn = _anim_state
+    frames = []
+    with time_fn as t:
+        for time in times:
+            t(time)
+            frames.append(pg[:])
+    return frames
+
+
+
+_accepts_out = {}
+
+def _call_accepts_out(pg):
+    """
+    Return True if calling the PatternGenerator pg accepts an out
+    array to render into (see PatternGenerator.__call__), which may not
+    be the case for subclasses that reimplement __call__.
+    """
+    cls = type(pg)
+    if cls not in _accepts_out:
+        # Look through any wrapper, e.g. installed by imagen.profile()
+        call = getattr(cls.__call__,'__wrapped__',cls.__call__)
+        try:
+            args = inspect.getfullargspec(call).args
+        except AttributeError:
+            args = inspect.getargspec(call).args
+        _accepts_out[cls] = 'out' in args
+    return _accepts_out[cls]
+
+
+
+def _overrides(pg,base,name='__call__'):
+    """
+    Return True if the class of pg reimplements the method name of the
+    class base.
+    """
+    method = lambda cls: getattr(getattr(cls,name),'__func__',getattr(cls,name))
+    return method(type(pg)) is not method(base)
+
+
+def _renders_in_parts(pg):
+    """
+    Return True if the PatternGenerator pg can render any part of its
+    pattern on its own, from the coordinates within that part (see
+    PatternGenerator.render_region), and so one band or tile at a
+    time.  The type of the pattern is then found by rendering a
+    single sample, before allocating the array for the whole.
+
+    Generators that reimplement __call__ cannot, since their pattern
+    is not the one _render computes from function(), and nor can
+    those whose _windowed attribute is False, because they are drawn
+    by rendering other generators over the full bounds (e.g. Sweeper)
+    or are normalized over the full bounds (e.g.
+    DifferenceOfGaussians).
+    """
+    return pg._windowed and not _overrides(pg,PatternGenerator)
+
+
+
+class _ResolvedParams(dict):
+    """
+    Parameter values by name, also accessible as attributes, for use
+    in place of ParamOverrides where all the values are known already.
+    """
+
+    def __getattr__(self,name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+
+class CompiledPattern(object):
+    """
+    Callable rendering a PatternGenerator using parameter values that
+    were resolved once, when it was created by
+    PatternGenerator.compile(), rather than on every call.
+
+    Calling it is equivalent to calling the PatternGenerator with the
+    resolved values, except that only the parameters passed to the
+    call (e.g. x, y, orientation or phase) are varied, and that
+    Dynamic parameters are not advanced.  Generators that reimplement
+    __call__ (or that are memoized) are called with the values passed
+    to compile() and to the call, through the usual param machinery.
+    """
+
+    __slots__ = ['pattern','fixed','values','direct']
+
+    def __init__(self,pattern,fixed):
+        self.pattern = pattern
+        self.fixed = fixed
+        self.values = dict((name,fixed[name] if name in fixed else getattr(pattern,name))
+                           for name in pattern.params())
+        self.direct = (not _overrides(pattern,PatternGenerator) and
+                       not self.values['memoize'] and self.values['threads']==1)
+
+
+    def __call__(self,out=None,**varying):
+        for name in varying:
+            if name not in self.values:
+                raise TypeError("%s has no parameter %r" % (self.pattern.name,name))
+
+        if self.direct:
+            p = _ResolvedParams(self.values)
+            p.update(varying)
+            return self.pattern._render(p,out)
+
+        params = dict(self.fixed,**varying)
+        if out is None:
+            return self.pattern(**params)
+        elif _call_accepts_out(self.pattern):
+            return self.pattern(out=out,**params)
+        out[...] = self.pattern(**params)
+        return out
+
+
+
 # JLALERT: PatternGenerator should have
 # override_plasticity_state/restore_plasticity_state functions which
 # can override the plasticity of any output_fn that has state, in case
@@ -123,13 +420,84 @@ class PatternGenerator(param.Parameterized):
         Optional function(s) to apply to the pattern array after it has been created.
         Can be used for normalization, thresholding, etc.""")
 
+    memoize = param.Boolean(default=False,precedence=-1,doc="""
+        Whether to keep the patterns rendered by this generator in
+        imagen.patterngenerator.result_cache, returning the cached,
+        read-only array when called again with the same resolved
+        parameter values (including bounds, densities, mask, mask_shape
+        and output_fns, and any generators this one combines).  The
+        cache holds at most result_cache.max_bytes, discarding the
+        least recently used patterns first.
+
+        Patterns that depend on random state, e.g. from
+        RandomGenerators or from Dynamic parameters that draw a new
+        value on every call, are never cached; Dynamic values that are
+        a function of time are cached for the current time only.
+        Generators that override __call__ are not cached.""")
+
+    dtype = param.Parameter(default=np.float64,precedence=-1,doc="""
+        Floating-point type of the pattern array, e.g. numpy.float32 to
+        halve the memory used.  The coordinate arrays, masks and
+        patterns of any generators combined into this one are computed
+        at the same precision, and the output_fns receive an array of
+        this type.  Can be set on PatternGenerator itself to change the
+        default for all patterns.""")
+
+    threads = param.Integer(default=1,bounds=(1,None),precedence=-1,doc="""
+        Number of threads rendering the pattern, each computing a band
+        of rows directly into the output array.  Since numpy releases
+        the GIL for arithmetic on large arrays, large patterns render
+        faster on several cores.  The pattern is the same as when
+        rendered by a single thread, so patterns that cannot be
+        computed one part at a time (see render_region), that depend
+        on random state, or that override __call__ are rendered by the
+        calling thread alone; output_fns are applied to the whole
+        pattern once all the bands are complete.""")
+
+    # Parameters that render_batch can vary across a batch by
+    # broadcasting, evaluating function() once for the whole batch.
+    # x, y, orientation, scale and offset are handled here and need not
+    # be listed.  None means that function() does not broadcast (e.g.
+    # because it branches on parameter values or calls other
+    # generators), so that render_batch renders one frame at a time.
+    _batch_params = None
+
+    # True if function() is a product (or minimum, etc.) of separate
+    # functions of pattern_x and pattern_y, so that at multiples of
+    # pi/2 it can be evaluated on a single row of pattern_x and a
+    # single column of pattern_y (or vice versa) and then broadcast,
+    # rather than on full coordinate matrices.  See _setup_xy.
+    _separable = False
+
+    # False if the pattern can differ between calls with the same
+    # parameter values, e.g. because it is drawn from a random number
+    # generator, so that it must not be memoized.
+    _deterministic = True
+
+    # True if function() computes the pattern from pattern_x and
+    # pattern_y alone, so that any window of it can be rendered by
+    # supplying only the coordinates in that window (see
+    # render_region).  False e.g. for patterns built from other
+    # generators rendered over the full bounds.
+    _windowed = True
+
+    # True if function() may return the pattern of another generator
+    # as it is (e.g. Selector), rather than a new array.  That array
+    # may still be in use elsewhere (e.g. cached by a FileImage), so
+    # it is copied before being modified in place (see _own_pattern).
+    _passes_through = False
+
+    # True if the pattern is always drawn about the origin, whatever
+    # its x and y (e.g. RadialGrating).
+    _centred = False
+
 
     def __init__(self,**params):
         super(PatternGenerator, self).__init__(**params)
         self.set_matrix_dimensions(self.bounds, self.xdensity, self.ydensity)
 
 
-    def __call__(self,**params_to_override):
+    def __call__(self,out=None,**params_to_override):
         """
         Call the subclass's 'function' method on a rotated and scaled
         coordinate system.
@@ -138,11 +506,254 @@ class PatternGenerator(param.Parameterized):
         called without any params, uses the values for the Parameters
         as currently set on the object. Otherwise, any params
         specified override those currently set on the object.
+
+        If an array is supplied as out, the pattern is written into it
+        and it is returned, instead of a new array being allocated.
+        The array must have the shape of the SheetCoordinateSystem.
         """
         if 'output_fns' in params_to_override:
             self.warning("Output functions specified through the call method will be ignored.")
 
         p=ParamOverrides(self,params_to_override)
+        render = self._render_tiled if p.threads > 1 else self._render
+        if p.memoize:
+            try:
+                key = _memo_parameters(self,p)
+            except _Unmemoizable:
+                return render(p,out)
+            pattern = result_cache.lookup(key,lambda: (render(p),))[0]
+            if out is None:
+                return pattern
+            out[...] = pattern
+            return out
+        return render(p,out)
+
+
+    def render_region(self,region,out=None,**params_to_override):
+        """
+        Render only part of the pattern, returning the same values as
+        the corresponding part of the array returned by __call__.
+
+        The region is either a BoundingBox, selecting the samples whose
+        sheet coordinates lie within it, or a pair of slices (rows,cols)
+        of the pattern matrix, with a step of 1.  Only the coordinates
+        within the region are generated, so the cost scales with its
+        area, except for patterns that can only be computed as a whole
+        (e.g. with output_fns, or random patterns), which are rendered
+        in full and then cropped.  Composites and Selectors pass the
+        region on to their generators.
+
+        If an array is supplied as out, it must have the shape of the
+        region.  Other parameters are as for __call__.
+        """
+        p = ParamOverrides(self,params_to_override)
+        if isinstance(region,BoundingBox):
+            region = self._region_window(region,p.bounds,p.xdensity,p.ydensity)
+        rows,cols = region
+        shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
+        indices = rows.indices(shape[0]),cols.indices(shape[1])
+        if indices[0][2]!=1 or indices[1][2]!=1:
+            raise ValueError("render_region only supports slices with a step of 1.")
+        window = (slice(*indices[0][:2]),slice(*indices[1][:2]))
+        return self._render_region(p,window,out)
+
+
+    @staticmethod
+    def _region_window(region,bounds,xdensity,ydensity):
+        """
+        Return the (rows,cols) slices of the pattern matrix for the
+        given bounds and densities whose samples lie within the
+        BoundingBox region.
+        """
+        left,bottom,right,top = region.lbrt()
+        x_points,y_points = SheetCoordinateSystem(bounds,xdensity,ydensity).sheetcoordinates_of_matrixidx()
+        cols = np.flatnonzero((x_points>=left) & (x_points<=right))
+        rows = np.flatnonzero((y_points>=bottom) & (y_points<=top))
+        if len(cols)==0 or len(rows)==0:
+            return slice(0,0),slice(0,0)
+        return slice(rows[0],rows[-1]+1),slice(cols[0],cols[-1]+1)
+
+
+    def _render_region(self,p,window,out=None):
+        """
+        Render the part of the pattern for the parameters p within
+        window, a pair of slices (rows,cols) of the full matrix; see
+        render_region.
+        """
+        if _renders_in_parts(self) and not p.output_fns:
+            return self._render(p,out,window)
+
+        pattern = self(**p)[window]
+        if out is None:
+            return pattern.copy()
+        out[...] = pattern
+        return out
+
+
+    def _render_tiled(self,p,out=None):
+        """
+        Render the pattern for the parameters p, as for _render, with
+        p.threads threads each rendering one band of rows.
+
+        All the threads render using this generator (and any it
+        combines), each evaluating any Dynamic parameters for itself,
+        which is why this is only done if the values are determined by
+        the current time.
+        """
+        shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
+        bands = self._row_bands(shape,-(-shape[0]//p.threads))
+        if not (len(bands)>1 and _renders_in_parts(self)):
+            return self._render(p,out)
+        try:
+            _memo_parameters(self,p,timed=True,digest=False)
+        except _Unmemoizable:
+            return self._render(p,out)
+
+        overrides = dict(p,output_fns=[],threads=1)
+        if out is None:
+            sample = self._render_region(ParamOverrides(self,overrides),(slice(0,1),slice(0,1)))
+            out = np.empty(shape,sample.dtype)
+
+        def render_band(band):
+            self._render_region(ParamOverrides(self,overrides),band,out[band])
+
+        pool = ThreadPool(len(bands))
+        try:
+            pool.map(render_band,bands)
+        finally:
+            pool.close()
+            pool.join()
+        self._apply_output_fns(p,out)
+        return out
+
+
+    @staticmethod
+    def _row_bands(shape,rows):
+        """
+        Return the windows (see render_region) dividing a matrix of the
+        given shape into bands of the given number of rows (fewer for
+        the last band).
+        """
+        return [(slice(start,min(start+rows,shape[0])),slice(0,shape[1]))
+                for start in range(0,shape[0],max(rows,1))]
+
+
+    @staticmethod
+    def _tiles(shape,tile):
+        """
+        Return the windows (see render_region) dividing a matrix of the
+        given shape into tiles of the given (rows,cols) shape (smaller
+        at the bottom and right edges).  A single number is taken as
+        the size of square tiles.
+        """
+        rows,cols = (tile,tile) if np.isscalar(tile) else tile
+        return [(slice(r,min(r+rows,shape[0])),slice(c,min(c+cols,shape[1])))
+                for r in range(0,shape[0],max(rows,1))
+                for c in range(0,shape[1],max(cols,1))]
+
+
+    def render_to_memmap(self,path,tile=1024,**params_to_override):
+        """
+        Render the pattern into a new .npy file at path, one tile at a
+        time, returning it as a memory-mapped array (see
+        numpy.lib.format.open_memmap).  Patterns too large to fit in
+        memory can then be rendered, as only one tile of the pattern
+        is held in memory at once.
+
+        The tile is the (rows,cols) shape of the tiles, or a single
+        number for square tiles.  Output functions that act on each
+        element independently are applied to each tile as it is
+        rendered.  Divisive normalizations (DivisiveNormalizeL1, L2,
+        Linf and Lp) need the norm of the whole pattern, and are
+        applied in a second pass over the tiles after computing the
+        norm from those of the tiles; other output functions cannot be
+        applied one tile at a time and raise a ValueError.
+
+        Patterns that cannot be rendered one part at a time (e.g.
+        random patterns, or generators that override __call__) are
+        rendered whole and then written to the file.  Other parameters
+        are as for __call__.
+        """
+        p = ParamOverrides(self,params_to_override)
+        passes = [[]]
+        for of in p.output_fns:
+            if getattr(of,'_pointwise',False):
+                passes[-1].append(of)
+            elif hasattr(of,'_combined_norm'):
+                passes.append([of])
+            else:
+                raise ValueError("%s cannot be applied one tile at a time."%type(of).__name__)
+
+        shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
+        try:
+            _memo_parameters(self,p,timed=True,digest=False)
+            tiled = _renders_in_parts(self)
+        except _Unmemoizable:
+            tiled = False
+        if not tiled:
+            pattern = self(**p)
+            out = np.lib.format.open_memmap(path,mode='w+',dtype=pattern.dtype,shape=shape)
+            out[...] = pattern
+            out.flush()
+            return out
+
+        tile_p = ParamOverrides(self,dict(p,output_fns=[],threads=1))
+        sample = self._render_region(tile_p,(slice(0,1),slice(0,1)))
+        out = np.lib.format.open_memmap(path,mode='w+',dtype=sample.dtype,shape=shape)
+        windows = self._tiles(shape,tile)
+        for window in windows:
+            self._render_region(tile_p,window,out[window])
+            for of in passes[0]:
+                of(out[window])
+
+        # Each later pass starts with a normalization, for which the
+        # norm of the whole pattern is found first
+        for normalize,rest in ((fns[0],fns[1:]) for fns in passes[1:]):
+            norm = normalize._combined_norm([normalize._partial_norm(out[window])
+                                             for window in windows])
+            for window in windows:
+                if norm != 0:
+                    out[window] *= normalize.norm_value/norm
+                for of in rest:
+                    of(out[window])
+        out.flush()
+        return out
+
+
+    def compile(self,**fixed):
+        """
+        Return a CompiledPattern rendering this pattern with the
+        values of all its parameters resolved now, as overridden by
+        any given as keyword arguments.  Calling it with the parameters
+        to vary (e.g. x or orientation) avoids the overhead of
+        resolving the rest on every call, which dominates the time
+        taken to render small patterns.
+
+        Changes to this PatternGenerator's parameters after compiling
+        do not affect the CompiledPattern, and Dynamic parameters keep
+        the values they had when it was compiled.
+        """
+        if 'output_fns' in fixed:
+            self.warning("Output functions specified through the call method will be ignored.")
+            fixed = dict(fixed)
+            del fixed['output_fns']
+        return CompiledPattern(self,fixed)
+
+
+    def _render(self,p,out=None,window=None):
+        """
+        Render the pattern for the parameters p, as for __call__.
+
+        If window is supplied, as a pair of slices (rows,cols) of the
+        full pattern matrix, only that part of the pattern is rendered
+        (see render_region).  Any mask in p still covers the full
+        matrix.
+        """
+        # Available to function() implementations that can write
+        # their result directly into the output buffer (e.g. Composite),
+        # or that pass the window on to other generators
+        p._out = out
+        p._window = window
 
         # CEBERRORALERT: position parameter is not currently
         # supported. We should delete the position parameter or fix
@@ -151,22 +762,207 @@ class PatternGenerator(param.Parameterized):
         # position=params_to_override.get('position',None) if position
         # is not None: x,y = position
 
-        self._setup_xy(p.bounds,p.xdensity,p.ydensity,p.x,p.y,p.orientation)
+        # Patterns that are the same at every orientation are drawn on
+        # the unrotated grid, which is then shared by all orientations
+        orientation = p.orientation
+        if self._rotationally_symmetric(p):
+            orientation = 0.0
+
+        # The coordinates are kept on p rather than on self, so that
+        # the same generator can render in several threads at once
+        x,y = p.x,p.y
+        if self._centred:
+            x,y = 0.0,0.0
+        p._xy_args = (p.bounds,p.xdensity,p.ydensity,x,y,orientation,p.dtype,window)
+        p.pattern_x, p.pattern_y = self._setup_xy(*p._xy_args)
         fn_result = self.function(p)
+        if p.pattern_x.shape != p.pattern_y.shape:
+            fn_result = self._broadcast_separable(p,fn_result)
+        fn_result = self._own_pattern(p,fn_result,out)
         self._apply_mask(p,fn_result)
-        if p.scale != 1.0:
-            result = p.scale * fn_result
-        else:
-            result = fn_result
+        result = self._apply_scale_offset(p,fn_result,out)
+        self._apply_output_fns(p,result)
+        return result
+
+
+    def _own_pattern(self,p,fn_result,out=None):
+        """
+        Return fn_result, or a copy of it (in out, if supplied) if it
+        may not be modified in place but the mask, scale, offset or
+        output_fns in p would modify it.  That is the case for arrays
+        that are read-only (e.g. memoized patterns), and for patterns
+        of other generators (see _passes_through).
+        """
+        read_only = isinstance(fn_result,np.ndarray) and not fn_result.flags.writeable
+        if not (self._passes_through or read_only):
+            return fn_result
+        if (p.mask is None and p.mask_shape is None and not p.output_fns
+            and p.scale == 1.0 and p.offset == 0.0):
+            return fn_result
+        if out is None:
+            return np.array(fn_result)
+        out[...] = fn_result
+        return out
+
+
+    def _apply_scale_offset(self,p,fn_result,out=None):
+        """
+        Return fn_result scaled and offset as specified by p, stored
+        in out if supplied, or else converted to p.dtype.
+        """
+        result = self._scale_into(p.scale,fn_result,out,p.dtype)
         if p.offset != 0.0:
             result += p.offset
+        if out is not None:
+            return out
+        return self._as_dtype(result,p.dtype)
+
 
+    def _apply_output_fns(self,p,result):
+        """Apply the output_fns in p to the given matrix result, in place."""
         for of in p.output_fns:
             of(result)
 
+
+    def _broadcast_separable(self,p,fn_result):
+        """
+        Expand a pattern drawn on the separable coordinate vectors in p
+        to the full matrix shape, if it is not already of that shape.
+        """
+        shape = np.broadcast(p.pattern_x,p.pattern_y).shape
+        if np.shape(fn_result)==shape:
+            return fn_result
+        full = np.empty(shape,np.result_type(fn_result))
+        full[...] = fn_result
+        return full
+
+
+    @staticmethod
+    def _as_dtype(result,dtype):
+        """
+        Return the floating-point array result converted to dtype, if
+        it is not already of that type.
+
+        Non-floating-point results (e.g. boolean patterns) are returned
+        unchanged, as are arrays supplied by the caller.
+        """
+        if result.dtype.kind=='f' and result.dtype!=dtype:
+            return result.astype(dtype)
         return result
 
 
+    @staticmethod
+    def _scale_into(scale,fn_result,out,dtype=None):
+        """
+        Return fn_result multiplied by scale, stored in out if supplied
+        (or else in a new array of the given dtype).
+
+        Where possible the multiplication is done in place rather
+        than allocating a new array; arrays that are read-only or that
+        are not floating point (e.g. boolean masks) are never modified.
+        The caller must ensure that fn_result is not in use elsewhere
+        (see _own_pattern).
+        """
+        if out is not None:
+            if scale != 1.0:
+                np.multiply(fn_result,scale,out=out)
+            elif fn_result is not out:
+                out[...] = fn_result
+            return out
+        if scale == 1.0:
+            return fn_result
+        if (isinstance(fn_result,np.ndarray) and fn_result.dtype.kind=='f'
+            and fn_result.flags.writeable):
+            fn_result *= scale
+            return fn_result
+        return np.multiply(scale,fn_result,dtype=dtype)
+
+
+    def render_batch(self,**params):
+        """
+        Render a stack of patterns, returned as an (N,rows,cols) array.
+
+        Any parameter may be given a one-dimensional sequence of N
+        values instead of a single value, and frame i is then the
+        pattern obtained by calling the generator with the i'th value
+        of each such sequence, e.g.::
+
+          Gaussian().render_batch(x=np.linspace(-0.4,0.4,100),
+                                  orientation=np.random.uniform(0,pi,100))
+
+        Other parameters are treated as for __call__.
+
+        Where the class supports it (see _batch_params and
+        _batch_broadcastable), the whole batch is computed in one
+        vectorized evaluation rather than frame by frame.  In that
+        case any dynamic parameter not supplied is evaluated only
+        once, and the resulting value is shared by all frames of the
+        batch.
+        """
+        arrays = {}
+        for name,value in params.items():
+            value = np.asarray(value) if isinstance(value,(list,tuple,np.ndarray)) else value
+            if isinstance(value,np.ndarray) and value.ndim==1 and value.dtype.kind in 'biuf':
+                arrays[name] = value
+        if not arrays:
+            raise ValueError("render_batch requires a sequence of values for at least one parameter.")
+        lengths = set(len(v) for v in arrays.values())
+        if len(lengths)!=1:
+            raise ValueError("All sequences supplied to render_batch must have the same length.")
+        n = lengths.pop()
+
+        scalars = dict((k,v) for k,v in params.items() if k not in arrays)
+        p = ParamOverrides(self,scalars)
+        shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
+        result = np.empty((n,)+shape,p.dtype)
+
+        broadcastable = self._batch_broadcastable()
+        if (broadcastable is None or p.mask_shape is not None or
+            not set(arrays).issubset(broadcastable)):
+            for i in range(n):
+                frame_params = dict((k,v[i]) for k,v in arrays.items())
+                frame_params.update(scalars)
+                result[i] = self(**frame_params)
+            return result
+
+        for name,values in arrays.items():
+            p[name] = values.reshape(n,1,1)
+
+        x_points,y_points = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).sheetcoordinates_of_matrixidx()
+        x_points,y_points = np.asarray(x_points,p.dtype),np.asarray(y_points,p.dtype)
+        x = x_points-np.reshape(np.asarray(p.x,p.dtype),np.shape(p.x)[:-1])
+        y = y_points-np.reshape(np.asarray(p.y,p.dtype),np.shape(p.y)[:-1])
+        p.pattern_x, p.pattern_y = self._create_and_rotate_coordinate_arrays(x,y,p.orientation)
+
+        result[...] = self.function(p)
+        if p.mask is not None:
+            result *= p.mask
+        result *= p.scale
+        result += p.offset
+
+        for frame in result:
+            for of in p.output_fns:
+                of(frame)
+
+        return result
+
+
+    def _batch_broadcastable(self):
+        """
+        Return the parameters that render_batch can vary by
+        broadcasting through function(), or None if it must render
+        one frame at a time.  The latter is also the case if __call__
+        is overridden below the class declaring _batch_params, since
+        the pattern is then not the one drawn by that function().
+        """
+        mro = type(self).__mro__
+        declared = next(cls for cls in mro if '_batch_params' in cls.__dict__)
+        called = next(cls for cls in mro if '__call__' in cls.__dict__)
+        if self._batch_params is None or mro.index(called) < mro.index(declared):
+            return None
+        return ('x','y','orientation','scale','offset')+self._batch_params
+
+
     def __getitem__(self, coords):
         value_dims = {}
         if self.num_channels() in [0, 1]:
@@ -210,22 +1006,179 @@ class PatternGenerator(param.Parameterized):
         return 1
 
 
-    def _setup_xy(self,bounds,xdensity,ydensity,x,y,orientation):
+    def _setup_xy(self,bounds,xdensity,ydensity,x,y,orientation,dtype=np.float64,window=None):
         """
-        Produce pattern coordinate matrices from the bounds and
-        density (or rows and cols), and transforms them according to
-        x, y, and orientation.
+        Return the pattern coordinate matrices (pattern_x,pattern_y)
+        produced from the bounds and density (or rows and cols), and
+        transformed according to x, y, and orientation.  The matrices
+        have the floating-point type dtype, and if window is a pair of
+        slices (rows,cols) they cover only that part of the full
+        matrices.
+
+        For _separable patterns at a multiple of pi/2, pattern_x and
+        pattern_y are instead a single row and a single column (in
+        either order), which broadcast against each other to give the
+        full matrices.
         """
         self.debug("bounds=%s, xdensity=%s, ydensity=%s, x=%s, y=%s, orientation=%s",bounds,xdensity,ydensity,x,y,orientation)
-        # Generate vectors representing coordinates at which the pattern
-        # will be sampled.
 
-        # CB: note to myself - use slice_._scs if supplied?
-        x_points,y_points = SheetCoordinateSystem(bounds,xdensity,ydensity).sheetcoordinates_of_matrixidx()
+        turns = self._quarter_turns(orientation) if self._separable else None
+
+        def create():
+            # Generate vectors representing coordinates at which the
+            # pattern will be sampled.
+
+            # CB: note to myself - use slice_._scs if supplied?
+            x_points,y_points = SheetCoordinateSystem(bounds,xdensity,ydensity).sheetcoordinates_of_matrixidx()
+            x_points,y_points = np.asarray(x_points,dtype),np.asarray(y_points,dtype)
+            if window is not None:
+                x_points,y_points = x_points[window[1]],y_points[window[0]]
+            # x and y may be float64 scalars (e.g. from a Composite),
+            # which would otherwise promote the grids to float64
+            x_points,y_points = x_points-np.asarray(x,dtype),y_points-np.asarray(y,dtype)
+
+            if turns is not None:
+                return self._create_separable_coordinate_arrays(x_points,y_points,turns)
+
+            # Generate matrices of x and y sheet coordinates at which to
+            # sample pattern, at the correct orientation
+            return self._create_and_rotate_coordinate_arrays(x_points,y_points,orientation)
+
+        # The cached grids are shared and read-only, so function()
+        # implementations must not modify pattern_x or pattern_y in place.
+        key = self._coordinate_key(bounds,xdensity,ydensity,x,y,orientation,dtype,window,turns)
+        return coordinate_cache.lookup(key,create)
+
+
+    def _coordinate_key(self,bounds,xdensity,ydensity,x,y,orientation,dtype,window,turns=None):
+        """
+        Return the coordinate_cache key for the grids returned by
+        _setup_xy for these arguments.
+        """
+        window_key = None if window is None else tuple((w.start,w.stop) for w in window)
+        if turns is None:
+            return (type(self)._create_and_rotate_coordinate_arrays,
+                    tuple(bounds.lbrt()),xdensity,ydensity,x,y,orientation,np.dtype(dtype),window_key)
+        return (PatternGenerator._create_separable_coordinate_arrays,
+                tuple(bounds.lbrt()),xdensity,ydensity,x,y,turns,np.dtype(dtype),window_key)
+
+
+    def _setup_radius(self,p,aspect_ratio=1.0):
+        """
+        Return the distance from the origin of each of the points
+        (p.pattern_x/aspect_ratio,p.pattern_y).
+
+        Together with _setup_angle, this gives the polar coordinates of
+        the grids set up by _setup_xy, which are cached with them, so
+        that patterns drawn in polar coordinates (e.g. Disk, Ring,
+        Wedge and Spiral) share a single transform of each grid.  As
+        for pattern_x and pattern_y, the array must not be modified in
+        place.
+        """
+        return self._polar_coordinate(p,aspect_ratio,np.hypot)
+
+
+    def _setup_angle(self,p,aspect_ratio=1.0):
+        """
+        Return the angle, in [-pi,pi] and measured anticlockwise from
+        the pattern's x axis, of each of the points
+        (p.pattern_x/aspect_ratio,p.pattern_y).  See _setup_radius.
+        """
+        return self._polar_coordinate(p,aspect_ratio,np.arctan2)
+
+
+    def _polar_coordinate(self,p,aspect_ratio,ufunc):
+        """
+        Return ufunc(y,x) (i.e. hypot or arctan2) for the points (x,y)
+        of _setup_radius, cached alongside the grids in p.
+        """
+        def create():
+            x = p.pattern_x if aspect_ratio==1.0 else np.divide(p.pattern_x,aspect_ratio)
+            return (ufunc(p.pattern_y,x),)
+
+        # Grids not set up by _render (e.g. the stacks of grids used by
+        # render_batch) are not cached
+        xy_args = getattr(p,'_xy_args',None)
+        if xy_args is None or self._separable:
+            return create()[0]
 
-        # Generate matrices of x and y sheet coordinates at which to
-        # sample pattern, at the correct orientation
-        self.pattern_x, self.pattern_y = self._create_and_rotate_coordinate_arrays(x_points-x,y_points-y,orientation)
+        key = (ufunc,aspect_ratio,self._coordinate_key(*xy_args))
+        return coordinate_cache.lookup(key,create)[0]
+
+
+    @staticmethod
+    def _quarter_turns(orientation):
+        """
+        Return the number of quarter turns (0 to 3) equivalent to
+        orientation if it is a multiple of pi/2, and None otherwise.
+        """
+        turns = orientation/(pi/2)
+        nearest = round(turns)
+        if abs(turns-nearest) > 1e-12:
+            return None
+        return int(nearest)%4
+
+
+    @staticmethod
+    def _create_separable_coordinate_arrays(x, y, turns):
+        """
+        Return pattern_x and pattern_y as a broadcastable row and
+        column, rotated by the given number of quarter turns.
+
+        These are the vectors from which the full matrices produced by
+        _create_and_rotate_coordinate_arrays would be built, since at
+        multiples of pi/2 each of pattern_x and pattern_y depends only
+        on the sheet x or only on the sheet y coordinate.
+        """
+        row = x.reshape(1,-1)
+        column = y.reshape(-1,1)
+        return [(row,column),(column,-row),(-row,-column),(-column,row)][turns]
+
+
+    def _child_generators(self,structure,create):
+        """
+        Return the list of generators returned by create(), which is
+        kept and reused by later calls for as long as structure (e.g.
+        the number of parts of the pattern) is unchanged.
+
+        Constructing Parameterized objects costs more than rendering a
+        small pattern, so patterns drawn by other generators keep them
+        rather than constructing them on every call, passing the values
+        that vary between calls as parameter overrides.  The children
+        must not be modified, so that the same generator can still
+        render in several threads at once.
+        """
+        children = getattr(self,'_children',None)
+        if children is None or children[0]!=structure:
+            children = (structure,create())
+            self._children = children
+        return children[1]
+
+
+    def _rotationally_symmetric(self,p):
+        """
+        Return True if the pattern for the parameters p is the same at
+        every orientation (e.g. a circular Disk), as it is not by
+        default.  The pattern is then drawn on the unrotated coordinate
+        grid, so that the grid and the values cached with it (e.g. by
+        _setup_radius) depend only on the bounds, density, x and y,
+        and are reused when just the orientation changes.
+        """
+        return False
+
+
+    def _support(self,p,threshold=0.0):
+        """
+        Return the half-width and half-height, in the pattern's own
+        (unrotated) coordinates about (p.x,p.y), of a box outside which
+        function() is below threshold, or exactly zero for a threshold
+        of zero.  Either may be infinite.
+
+        Returns None if the pattern has no such bound, as by default.
+        Used by Composite to render small components only where they
+        are non-zero.
+        """
+        return None
 
 
     def function(self,p):
@@ -239,6 +1192,10 @@ class PatternGenerator(param.Parameterized):
         can be reimplemented entirely by a subclass (e.g. if it does
         not need to do any scaling or rotation), in which case this
         function will be ignored.
+
+        The pattern is drawn at the coordinates p.pattern_x and
+        p.pattern_y, which are specific to this call so that the same
+        generator can be rendered by several threads at once.
         """
         raise NotImplementedError
 
@@ -247,25 +1204,47 @@ class PatternGenerator(param.Parameterized):
         """
         Create pattern matrices from x and y vectors, and rotate them
         to the specified orientation.
+
+        Leading dimensions of x and y (and of orientation, which then
+        has two trailing dimensions of length one) are broadcast, so
+        that a stack of differently placed and rotated coordinate
+        grids can be created at once.
         """
         # Using this two-liner requires that x increase from left to
         # right and y decrease from left to right; I don't think it
         # can be rewritten in so little code otherwise - but please
         # prove me wrong.
-        pattern_y = np.subtract.outer(np.cos(orientation)*y, np.sin(orientation)*x)
-        pattern_x = np.add.outer(np.sin(orientation)*y, np.cos(orientation)*x)
+        x = np.expand_dims(x,-2)
+        y = np.expand_dims(y,-1)
+        # Computed in the type of the coordinates, which the float64
+        # cosine and sine would otherwise promote
+        dtype = np.result_type(x,y)
+        cos,sin = np.asarray(np.cos(orientation),dtype),np.asarray(np.sin(orientation),dtype)
+        pattern_y = cos*y - sin*x
+        pattern_x = sin*y + cos*x
         return pattern_x, pattern_y
 
 
     def _apply_mask(self,p,mat):
-        """Create (if necessary) and apply the mask to the given matrix mat."""
+        """
+        Create (if necessary) and apply the mask to the given matrix
+        mat, which covers the window of the full matrix set on p by
+        _render, if any.
+        """
         mask = p.mask
         ms=p.mask_shape
+        window = getattr(p,'_window',None)
         if ms is not None:
-            mask = ms(x=p.x+p.size*(ms.x*np.cos(p.orientation)-ms.y*np.sin(p.orientation)),
-                      y=p.y+p.size*(ms.x*np.sin(p.orientation)+ms.y*np.cos(p.orientation)),
-                      orientation=ms.orientation+p.orientation,size=ms.size*p.size,
-                      bounds=p.bounds,ydensity=p.ydensity,xdensity=p.xdensity)
+            params = dict(x=p.x+p.size*(ms.x*np.cos(p.orientation)-ms.y*np.sin(p.orientation)),
+                          y=p.y+p.size*(ms.x*np.sin(p.orientation)+ms.y*np.cos(p.orientation)),
+                          orientation=ms.orientation+p.orientation,size=ms.size*p.size,
+                          bounds=p.bounds,ydensity=p.ydensity,xdensity=p.xdensity,dtype=p.dtype)
+            if window is None:
+                mask = ms(**params)
+            else:
+                mask = ms._render_region(ParamOverrides(ms,params),window)
+        elif mask is not None and window is not None:
+            mask = mask[window]
         if mask is not None:
             mat*=mask
 
@@ -305,7 +1284,7 @@ class PatternGenerator(param.Parameterized):
 
     def anim(self, duration, offset=0, timestep=1,
              label=None, unit=None,
-             time_fn=param.Dynamic.time_fn):
+             time_fn=param.Dynamic.time_fn, workers=None):
         """
         duration: The temporal duration to animate in the units
         defined on the global time function.
@@ -330,6 +1309,15 @@ class PatternGenerator(param.Parameterized):
         generators. Otherwise, the frames are generated by successive
         call to the pattern which may or may not be varying (e.g to
         view the patterns contained within a Selector).
+
+        workers: The number of processes in which to render the
+        frames, each rendering a contiguous range of times (if not
+        None).  The frames are identical to those rendered serially,
+        because this is only done if each frame is determined by the
+        time alone, i.e. if the pattern involves no random values
+        other than from time-dependent generators and keeps no state
+        between calls.  Otherwise, or if processes cannot be forked on
+        this platform, the frames are rendered serially.
         """
         frames = (duration // timestep) + 1
         if duration % timestep != 0:
@@ -341,6 +1329,20 @@ class PatternGenerator(param.Parameterized):
         unit = time_fn.unit if (not unit and hasattr(time_fn, 'unit')) else unit
         vmap = HoloMap(kdims=[Dimension(label, unit=unit if unit else '')])
 
+        if workers is not None and workers > 1 and frames > 1:
+            with time_fn as t:
+                t(offset)
+                times = []
+                for i in range(frames):
+                    times.append(t())
+                    t += timestep
+                frames = self._anim_parallel(times,time_fn,workers)
+            if frames is not None:
+                for time,frame in zip(times,frames):
+                    vmap[time] = frame
+                return vmap
+            frames = len(times)
+
         self.state_push()
         with time_fn as t:
             t(offset)
@@ -350,7 +1352,91 @@ class PatternGenerator(param.Parameterized):
         self.state_pop()
         return vmap
 
+
+    def iter_frames(self, duration, offset=0, timestep=1,
+                    time_fn=param.Dynamic.time_fn, out=None, with_time=False):
+        """
+        Generator yielding the patterns that anim() would display, as
+        bare arrays, so that any number of frames can be streamed
+        (e.g. into a model or a file) without keeping them in memory.
+
+        duration, offset, timestep and time_fn are as for anim().  If
+        with_time is True, (time, array) tuples are yielded instead.
+
+        If an array is supplied as out, every frame is rendered into
+        it and it is yielded each time, so a frame is only valid
+        until the next one is requested.
+
+        The time and the state of this generator are restored once
+        all the frames have been generated, or when the generator is
+        closed; until then, time_fn is held at the time of the
+        current frame.
+        """
+        frames = (duration // timestep) + 1
+        if duration % timestep != 0:
+            raise ValueError("The duration value must be an exact multiple of the timestep.")
+
+        self.state_push()
+        try:
+            with time_fn as t:
+                t(offset)
+                for i in range(int(frames)):
+                    if out is None:
+                        pattern = self()
+                    elif _call_accepts_out(self):
+                        pattern = self(out=out)
+                    else:
+                        pattern = out
+                        np.copyto(out,self())
+                    yield (t(),pattern) if with_time else pattern
+                    t += timestep
+        finally:
+            self.state_pop()
+
+
+    def _anim_parallel(self,times,time_fn,workers):
+        """
+        Return the frames for the given times as rendered by anim,
+        using the given number of forked processes, or None if they
+        cannot be rendered independently of each other.
+        """
+        global _anim_state
+        try:
+            _memo_parameters(self,{},timed=True)
+            context = multiprocessing.get_context('fork') \
+                if hasattr(multiprocessing,'get_context') else multiprocessing
+        except (_Unmemoizable,ValueError):
+            return None
+
+        size = -(-len(times)//workers)
+        chunks = [times[i:i+size] for i in range(0,len(times),size)]
+        _anim_state = (self,time_fn)
+        pool = context.Pool(len(chunks))
+        try:
+            rendered = pool.map(_anim_frames,chunks)
+        finally:
+            pool.terminate()
+            pool.join()
+            _anim_state = None
+        return [frame for chunk in rendered for frame in chunk]
+
     ## Support for compositional expressions of PatternGenerator objects
+
+    # Expressions such as a+b+c are built as nested Composites, but
+    # are rendered as flat ones where possible, i.e. as a single
+    # Composite of a, b and c rather than a Composite of (a+b) and c,
+    # since the patterns are then combined into one accumulator with
+    # no intermediate array for a+b (see Composite._flattened).  The
+    # nesting is resolved each time the pattern is rendered, so later
+    # changes to the nested Composites take effect.
+    def _operands(self,operator):
+        """
+        Return the list of patterns that operator combines to give
+        this pattern; simply [self] unless this is a Composite of
+        that operator.
+        """
+        return [self]
+
     def _promote(self,other):
         if not isinstance(other,PatternGenerator):
             other = Constant(scale=other,offset=0)
@@ -430,12 +1516,14 @@ class Constant(PatternGenerator):
 
     # Optimization: We use a simpler __call__ method here to skip the
     # coordinate transformations (which would have no effect anyway)
-    def __call__(self,**params_to_override):
+    def __call__(self,out=None,**params_to_override):
         p = ParamOverrides(self,params_to_override)
 
-        shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
-
-        result = p.scale*np.ones(shape, np.float)+p.offset
+        if out is None:
+            shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
+            out = np.empty(shape, p.dtype)
+        result = out
+        result.fill(p.scale*1.0+p.offset)
         self._apply_mask(p,result)
 
         for of in p.output_fns:
@@ -473,6 +1561,16 @@ class Composite(CompositeBase):
     # The Accum_Replace operator from LISSOM is not yet supported,
     # but it should be added once PatternGenerator bounding boxes
     # are respected and/or GenericImage patterns support transparency.
+    support_threshold = param.Number(default=0.0,bounds=(0.0,1.0),precedence=-1,doc="""
+        Value below which a component pattern may be treated as zero.
+
+        Components that report a bounded support (e.g. small Gaussians
+        or Disks) are rendered only within the region where their
+        value can exceed this threshold, rather than over the whole of
+        the bounds.  The default of zero gives results identical to
+        rendering every component in full, since the region then
+        extends to where the pattern underflows to exactly zero.""")
+
     operator = param.Parameter(np.maximum,precedence=0.98,doc="""
         Binary Numpy function used to combine the individual patterns.
 
@@ -505,6 +1603,44 @@ class Composite(CompositeBase):
         """)
 
 
+    # Parameter values for which a Composite only applies its operator
+    # to the patterns, without transforming them or the result
+    _plain_values = dict(x=0.0,y=0.0,orientation=0.0,size=1.0,scale=1.0,offset=0.0,
+                         mask=None,mask_shape=None,support_threshold=0.0)
+
+    def _operands(self,operator):
+        if type(self) is not Composite or self.operator is not operator or self.output_fns:
+            return [self]
+        for name,plain in self._plain_values.items():
+            value = self.get_value_generator(name)
+            if not (value is plain or (isinstance(value,(int,float)) and value==plain)):
+                return [self]
+        return list(self.generators)
+
+
+    @staticmethod
+    def _flattened(operator,generators):
+        """
+        Return the list of patterns to combine with the ufunc operator
+        in place of generators, expanding any plain Composites of the
+        same operator (see _operands) into the patterns they combine.
+
+        The first pattern can be expanded for any operator, since
+        reduce combines from the left; the others only for maximum
+        and minimum, which are exactly associative in floating point.
+        """
+        flat = []
+        for i,pg in enumerate(generators):
+            operands = [pg]
+            if i==0 or operator in (np.maximum,np.minimum):
+                operands = pg._operands(operator)
+            if len(operands)==1 and operands[0] is pg:
+                flat.append(pg)
+            else:
+                flat.extend(Composite._flattened(operator,operands))
+        return flat
+
+
     def _advance_pattern_generators(self,p):
         """
         Subclasses can override this method to provide constraints on
@@ -529,27 +1665,271 @@ class Composite(CompositeBase):
         for gen in self.generators:
             gen.state_pop()
 
-    # JABALERT: To support large numbers of patterns on a large input region,
-    # should be changed to evaluate each pattern in a small box, and then
-    # combine them at the full Composite Bounding box size.
-    def function(self,p):
-        """Constructs combined pattern out of the individual ones."""
+    def function(self,p,out=None):
+        """
+        Constructs combined pattern out of the individual ones.
+
+        For ufunc operators, the patterns are combined one at a time
+        into a single accumulator (out, if supplied, or else p._out as
+        set by __call__), so that only one child pattern needs to be
+        held in memory at once, and children with a bounded support
+        are rendered only within it (see support_threshold).  Other
+        operators receive the full list of patterns through their
+        reduce method.
+        """
         generators = self._advance_pattern_generators(p)
 
         assert hasattr(p.operator,'reduce'),repr(p.operator)+" does not support 'reduce'."
 
+        region = getattr(p,'_window',None)
+        if not isinstance(p.operator,np.ufunc):
+            if region is None:
+                return p.operator.reduce([pg(**self._child_params(p,pg,i)) for i,pg in enumerate(generators)])
+            return p.operator.reduce([pg._render_region(ParamOverrides(pg,self._child_params(p,pg,i)),region)
+                                      for i,pg in enumerate(generators)])
+        generators = self._flattened(p.operator,generators)
+
+        if out is None:
+            out = getattr(p,'_out',None)
+        if region is None:
+            shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
+        else:
+            shape = tuple(w.stop-w.start for w in region)
+        # The first pattern is rendered directly into the accumulator,
+        # and nested Composites and Constants into a single scratch
+        # array, so that a Composite of any number of patterns, or a
+        # nested expression, needs only one array per level of nesting
+        # in its right-hand operands
+        result = None
+        scratch = None
+        # Constants are combined as scalars rather than as arrays; any
+        # preceding the first other pattern are held until it is ready
+        leading = None
+        for i,pg in enumerate(generators):
+            value = self._constant_value(p,pg)
+            if value is not None:
+                if result is not None:
+                    result = self._combine_scalar(p.operator,result,value)
+                elif leading is None:
+                    leading = value
+                else:
+                    leading = p.operator(leading,value)
+                continue
+
+            if not self._fills_out(pg):
+                buffer = None
+            elif result is None:
+                buffer = out
+            else:
+                if scratch is None and result.dtype.kind=='f':
+                    scratch = np.empty(shape,result.dtype)
+                buffer = scratch
+            pattern,window = self._render_child(p,pg,i,buffer)
+            # Constants and Composites return a new array if not given
+            # a buffer; other patterns may be in use elsewhere
+            owned = buffer is not None or self._fills_out(pg)
+            result = self._combine(p.operator,result,pattern,window,shape,out,owned)
+            if leading is not None:
+                result = self._combine_scalar(p.operator,result,leading,first=True)
+                leading = None
+
+        if result is None:
+            result = out if out is not None else np.empty(shape,p.dtype)
+            result.fill(leading)
+        return result
+
+
+    def _child_params(self,p,pg,i):
+        """
+        Parameters with which to call the child pattern pg, the i'th
+        of the patterns combined.
+        """
         # CEBALERT: mask gets applied by all PGs including the Composite itself
         # (leads to redundant calculations in current lissom_oo_or usage, but
         # will lead to problems/limitations in the future).
-        patterns = [pg(xdensity=p.xdensity,ydensity=p.ydensity,
-                       bounds=p.bounds,mask=p.mask,
-                       x=p.x+p.size*(pg.x*np.cos(p.orientation)- pg.y*np.sin(p.orientation)),
-                       y=p.y+p.size*(pg.x*np.sin(p.orientation)+ pg.y*np.cos(p.orientation)),
-                       orientation=pg.orientation+p.orientation,
-                       size=pg.size*p.size)
-                    for pg in generators]
-        image_array = p.operator.reduce(patterns)
-        return image_array
+        return dict(xdensity=p.xdensity,ydensity=p.ydensity,
+                    bounds=p.bounds,mask=p.mask,dtype=p.dtype,
+                    x=p.x+p.size*(pg.x*np.cos(p.orientation)- pg.y*np.sin(p.orientation)),
+                    y=p.y+p.size*(pg.x*np.sin(p.orientation)+ pg.y*np.cos(p.orientation)),
+                    orientation=pg.orientation+p.orientation,
+                    size=pg.size*p.size)
+
+
+    def _render_child(self,p,pg,i,buffer=None):
+        """
+        Render the child pattern pg, the i'th of the patterns
+        combined, returning the pattern and the window (a pair of
+        slices) of the matrix being rendered that it covers, or None
+        if it covers the whole matrix.  The matrix is the window set
+        on p by _render, if any, or else the full matrix.  The pattern
+        is rendered into the corresponding part of buffer, if
+        supplied, in which case pg must accept an out argument.
+        """
+        params = self._child_params(p,pg,i)
+        child_p = ParamOverrides(pg,params)
+        region = getattr(p,'_window',None)
+        window = self._child_window(p,pg,child_p)
+        if region is not None:
+            window = region if window is None else self._intersect(window,region)
+        if window is None:
+            return pg(out=buffer,**params) if buffer is not None else pg(**params),None
+
+        rows,cols = window
+        if region is not None:
+            local = (slice(rows.start-region[0].start,rows.stop-region[0].start),
+                     slice(cols.start-region[1].start,cols.stop-region[1].start))
+        else:
+            local = window
+        if rows.start==rows.stop or cols.start==cols.stop:
+            return np.zeros((rows.stop-rows.start,cols.stop-cols.start),p.dtype),local
+        pattern = pg._render_region(child_p,window,None if buffer is None else buffer[local])
+        return pattern,(None if window==region else local)
+
+
+    @staticmethod
+    def _intersect(window,region):
+        """Return the window (a pair of slices) covering both window and region."""
+        bounded = []
+        for w,r in zip(window,region):
+            start = max(w.start,r.start)
+            bounded.append(slice(start,max(min(w.stop,r.stop),start)))
+        return tuple(bounded)
+
+
+    @staticmethod
+    def _fills_out(pg):
+        """
+        Return True if rendering pg into an out array writes the
+        pattern directly into it, rather than allocating it and then
+        copying it there, so that rendering into a reused array saves
+        memory.  Only the case for Constants and Composites.
+        """
+        return _call_accepts_out(pg) and (isinstance(pg,Constant) or
+            (isinstance(pg,Composite) and not _overrides(pg,Composite,'function')))
+
+
+    def _child_window(self,p,pg,child_p):
+        """
+        Return the (rows,cols) slices of the full matrix outside which
+        the child pattern is zero (or below support_threshold), or None
+        if the child must be rendered in full.
+        """
+        # Output functions (e.g. normalization) may depend on the
+        # whole pattern, and an offset or mask_shape changes the
+        # pattern outside its support
+        if child_p.output_fns or child_p.mask_shape is not None or child_p.offset != 0.0:
+            return None
+        support = pg._support(child_p,p.support_threshold)
+        if support is None or np.isnan(support).any():
+            return None
+
+        # Extent of the rotated support box along the sheet axes
+        cos,sin = abs(np.cos(child_p.orientation)),abs(np.sin(child_p.orientation))
+        half_width,half_height = support
+        x_extent = (cos*half_width if cos else 0.0) + (sin*half_height if sin else 0.0)
+        y_extent = (sin*half_width if sin else 0.0) + (cos*half_height if cos else 0.0)
+
+        x_points,y_points = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).sheetcoordinates_of_matrixidx()
+        cols = np.flatnonzero(abs(x_points-child_p.x) <= x_extent)
+        rows = np.flatnonzero(abs(y_points-child_p.y) <= y_extent)
+        if len(cols)==0 or len(rows)==0:
+            return slice(0,0),slice(0,0)
+        # Extended by a pixel on each side, to allow for rounding
+        # differences between the box and the rotated coordinates
+        return (slice(max(rows[0]-1,0),rows[-1]+2),
+                slice(max(cols[0]-1,0),cols[-1]+2))
+
+
+    def _constant_value(self,p,pg):
+        """
+        Return the value of pg, as a scalar of type p.dtype, if it is
+        a Constant that can be combined as a scalar rather than first
+        being rendered as a uniform array; otherwise return None.
+        """
+        if type(pg) is not Constant or p.mask is not None:
+            return None
+        if pg.mask_shape is not None or pg.output_fns:
+            return None
+        return np.dtype(p.dtype).type(pg.scale*1.0+pg.offset)
+
+
+    @staticmethod
+    def _combine_scalar(operator,result,value,first=False):
+        """
+        Combine the scalar value into the accumulated result with the
+        binary ufunc operator, in place where possible, as the left
+        operand if first is True and otherwise as the right.
+        """
+        if result.dtype.kind!='f':
+            result = result.astype(np.result_type(result,value))
+        if first:
+            operator(value,result,out=result)
+        else:
+            operator(result,value,out=result)
+        return result
+
+
+    @staticmethod
+    def _accumulator_dtype(operator,dtype):
+        """
+        Return the type in which operator.reduce would combine arrays
+        of the given type: the same type, except that booleans and
+        integers are added, subtracted and multiplied in at least the
+        default integer type, as for numpy.sum.
+        """
+        dtype = np.dtype(dtype)
+        if dtype.kind in 'biu' and operator in (np.add,np.subtract,np.multiply):
+            return np.result_type(dtype,np.uint if dtype.kind=='u' else np.int_)
+        return dtype
+
+
+    @staticmethod
+    def _combine(operator,result,pattern,window,shape,out=None,owned=False):
+        """
+        Combine pattern into the accumulated result (None for the first
+        pattern) with the binary ufunc operator, in place, giving the
+        same result as operator.reduce over the full patterns.  If
+        window is not None, pattern covers only that part of the full
+        matrix of the given shape, and is zero elsewhere.
+
+        The first pattern itself becomes the accumulator only if owned
+        is True, i.e. if it is a new array that is not in use
+        elsewhere; otherwise it is copied.
+        """
+        if result is None:
+            dtype = Composite._accumulator_dtype(operator,pattern.dtype)
+            if window is None:
+                if out is not None:
+                    if pattern is not out:
+                        out[...] = pattern
+                    return out
+                if owned and pattern.flags.writeable and pattern.dtype==dtype:
+                    return pattern
+                return pattern.astype(dtype)
+            if out is None:
+                out = np.zeros(shape,dtype)
+            else:
+                if np.may_share_memory(pattern,out):
+                    pattern = pattern.copy()
+                out[...] = 0
+            out[window] = pattern
+            return out
+
+        if out is None:
+            dtype = Composite._accumulator_dtype(operator,np.result_type(result,pattern))
+            if dtype != result.dtype:
+                result = result.astype(dtype)
+
+        if window is None:
+            operator(result,pattern,out=result)
+        elif operator in (np.add,np.subtract):
+            # Zero is the identity outside the window
+            operator(result[window],pattern,out=result[window])
+        else:
+            inside = result[window].copy()
+            operator(result,result.dtype.type(0),out=result)
+            operator(inside,pattern,out=result[window])
+        return result
 
 
 
@@ -646,7 +2026,7 @@ class ComposeChannels(ChannelGenerator):
             self._channel_data.append( None )
 
 
-    def __call__(self,**params):
+    def __call__(self,out=None,**params):
         # Generates all channels, then returns the default channel
 
         p = param.ParamOverrides(self,params)
@@ -654,6 +2034,7 @@ class ComposeChannels(ChannelGenerator):
         params['xdensity']=p.xdensity
         params['ydensity']=p.ydensity
         params['bounds']=p.bounds
+        params['dtype']=p.dtype
 
         # (not **p)
         for i in range(len(p.generators)):
@@ -663,4 +2044,8 @@ class ComposeChannels(ChannelGenerator):
         for c in self.channel_transforms:
             self._channel_data = c(self._channel_data)
 
-        return sum(act for act in self._channel_data)/len(self._channel_data)
+        result = sum(act for act in self._channel_data)/len(self._channel_data)
+        if out is not None:
+            out[...] = result
+            result = out
+        return result
@@ -0,0 +1,215 @@
+"""
+Profiling of the time and memory taken to render PatternGenerators.
+
+Use imagen.profile() as a context manager around the code to be
+profiled, e.g.::
+
+  with imagen.profile() as prof:
+      pattern()
+
+PatternGenerator methods are only instrumented while the context is
+active, so profiling has no cost at all when it is not in use.
+"""
+
+import time
+import collections
+
+import param
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from .patterngenerator import PatternGenerator
+
+_timer = getattr(time,'perf_counter',time.time)
+
+
+def _subclasses(cls):
+    """Return cls and all of its subclasses, recursively."""
+    classes = [cls]
+    for subclass in cls.__subclasses__():
+        classes.extend(c for c in _subclasses(subclass) if c not in classes)
+    return classes
+
+
+
+class Profile(param.Parameterized):
+    """
+    Context manager recording the time taken to render each
+    PatternGenerator instance, and each stage of rendering it, while
+    the context is active.
+
+    The records form a tree: the generators rendered while rendering
+    another one (e.g. the generators of a Composite, or a mask_shape)
+    appear below the stage of the parent in which they were rendered.
+    Records for the same path through the tree are aggregated, giving
+    the number of calls, the total wall time and the total over those
+    calls of the peak number of bytes allocated during each call
+    (including temporary arrays freed before it returned).
+
+    Only one Profile can be active at a time, and only rendering in
+    the thread that entered the context should be profiled.
+    """
+
+    memory = param.Boolean(default=True,doc="""
+        Whether to record the memory allocated, using tracemalloc.
+        This slows rendering down considerably, so the times are more
+        accurate without it.  Not available before Python 3.9.""")
+
+    report_on_exit = param.Boolean(default=True,doc="""
+        Whether to print the report() when the context exits.""")
+
+    # Methods of PatternGenerator (or any subclass that overrides
+    # them) to instrument, with the name of the stage of rendering
+    # they perform, or None for those rendering a whole pattern
+    _methods = [('__call__',None),
+                ('_render',None),
+                ('_setup_xy','coordinates'),
+                ('function','function'),
+                ('_apply_mask','mask'),
+                ('_apply_scale_offset','scale/offset'),
+                ('_apply_output_fns','output_fns')]
+
+    _active = None
+
+    def __init__(self,**params):
+        super(Profile,self).__init__(**params)
+        self.records = collections.OrderedDict()
+        self._stack = []
+        self._originals = []
+        self._memory = False
+        self._started_tracing = False
+
+
+    def __enter__(self):
+        if Profile._active is not None:
+            raise RuntimeError("Only one imagen.profile() can be active at a time.")
+        Profile._active = self
+
+        self._memory = self.memory and hasattr(tracemalloc,'reset_peak')
+        if self._memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        for cls in _subclasses(PatternGenerator):
+            for name,stage in self._methods:
+                if name in cls.__dict__:
+                    original = cls.__dict__[name]
+                    self._originals.append((cls,name,original))
+                    setattr(cls,name,self._wrap(original,stage))
+        return self
+
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        for cls,name,original in reversed(self._originals):
+            setattr(cls,name,original)
+        self._originals = []
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        Profile._active = None
+
+        if self.report_on_exit and exc_type is None:
+            print(self.report())
+
+
+    def _wrap(self,original,stage):
+        """
+        Return a replacement for the method original that records the
+        time taken by each call, under the given stage (or under the
+        generator it is called on, if stage is None).
+        """
+        static = isinstance(original,staticmethod)
+        method = original.__func__ if static else original
+
+        def wrapper(*args,**kwargs):
+            if static:
+                owner = self._stack[-1][0] if self._stack else None
+            else:
+                owner = args[0]
+            label = self._label(owner) if stage is None else stage
+            return self._record(owner,label,method,args,kwargs)
+
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        wrapper.__wrapped__ = method
+        return staticmethod(wrapper) if static else wrapper
+
+
+    @staticmethod
+    def _label(pg):
+        """Return the label of the generator pg in the report."""
+        name = type(pg).__name__
+        return pg.name if pg.name.startswith(name) else "%s (%s)" % (pg.name,name)
+
+
+    def _record(self,owner,label,method,args,kwargs):
+        """
+        Call method with args and kwargs, adding the time taken to the
+        record for label below the current position in the tree.
+        """
+        stack = self._stack
+        # e.g. __call__ calling _render, or a function() calling the
+        # function() of its superclass
+        if stack and stack[-1][0] is owner and stack[-1][1][-1] == label:
+            return method(*args,**kwargs)
+
+        path = (stack[-1][1] if stack else ()) + (label,)
+        record = self.records.setdefault(path,[0,0.0,0])
+        before = 0
+        if self._memory:
+            # The peak so far belongs to the caller, which keeps it on
+            # the stack while the peak of this call is measured
+            before,peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][2][0] = max(stack[-1][2][0],peak)
+            tracemalloc.reset_peak()
+        peak = [before]
+        stack.append((owner,path,peak))
+        start = _timer()
+        try:
+            return method(*args,**kwargs)
+        finally:
+            record[1] += _timer()-start
+            stack.pop()
+            if self._memory:
+                peak[0] = max(peak[0],tracemalloc.get_traced_memory()[1])
+                record[2] += peak[0]-before
+                if stack:
+                    stack[-1][2][0] = max(stack[-1][2][0],peak[0])
+            record[0] += 1
+
+
+    def report(self):
+        """Return the records as a table in the form of an indented tree."""
+        header = "%-60s %8s %12s" % ('','calls','time (ms)')
+        lines = [header+(" %14s" % 'peak bytes' if self._memory else '')]
+
+        def add(path):
+            calls,seconds,nbytes = self.records[path]
+            line = "%-60s %8d %12.3f" % ('  '*(len(path)-1)+path[-1],calls,1e3*seconds)
+            lines.append(line+(" %14d" % nbytes if self._memory else ''))
+            for child in self.records:
+                if len(child)==len(path)+1 and child[:-1]==path:
+                    add(child)
+
+        for path in self.records:
+            if len(path)==1:
+                add(path)
+        return "\n".join(lines)
+
+
+
+def profile(**params):
+    """
+    Return a Profile context manager, recording the time taken to
+    render PatternGenerators within the context, e.g.::
+
+      with imagen.profile(memory=False) as prof:
+          pattern()
+
+    Parameters of Profile can be passed as keyword arguments.
+    """
+    return Profile(**params)
@@ -52,6 +52,9 @@ class RandomGenerator(PatternGenerator, TimeAwareRandomState):
 
     __abstract = True
 
+    # Successive patterns are drawn from random_generator
+    _deterministic = False
+
     # The orientation is ignored, so we don't show it in
     # auto-generated lists of parameters (e.g. in the GUI)
     orientation = param.Number(precedence=-1)
@@ -79,7 +82,7 @@ class RandomGenerator(PatternGenerator, TimeAwareRandomState):
 
     # Optimization: We use a simpler __call__ method here to skip the
     # coordinate transformations (which would have no effect anyway)
-    def __call__(self,**params_to_override):
+    def __call__(self,out=None,**params_to_override):
         p = ParamOverrides(self,params_to_override)
         if self.time_dependent:
             if 'name' in p:
@@ -88,7 +91,15 @@ class RandomGenerator(PatternGenerator, TimeAwareRandomState):
 
         shape = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
 
+        # RandomState cannot generate into an existing array, nor
+        # generate single-precision values, so the distribution is
+        # copied into out or converted to the requested dtype
         result = self._distrib(shape,p)
+        if out is not None:
+            out[...] = result
+            result = out
+        else:
+            result = self._as_dtype(result,p.dtype)
         self._apply_mask(p,result)
 
         for of in p.output_fns:
@@ -181,13 +192,13 @@ class GaussianCloud(Composite, TimeAware):
         precedence=0.31,doc="""
         Ratio of gaussian width to height; width is gaussian_size*aspect_ratio.""")
 
-    def __call__(self,**params_to_override):
+    def __call__(self,out=None,**params_to_override):
         p = ParamOverrides(self,params_to_override)
         p.generators=[Gaussian(aspect_ratio=p.aspect_ratio,size=p.gaussian_size),
                       UniformRandom(name=p.name,
                                     time_dependent=p.time_dependent,
                                     time_fn = p.time_fn)]
-        return super(GaussianCloud,self).__call__(**p)
+        return super(GaussianCloud,self).__call__(out=out,**p)
 
 
 
@@ -239,7 +250,7 @@ class RandomDotStereogram(PatternGenerator):
                         precedence=0.54,doc="Seed value for the random position of the dots.")
 
 
-    def __call__(self,**params_to_override):
+    def __call__(self,out=None,**params_to_override):
         p = ParamOverrides(self,params_to_override)
 
         xsize,ysize = SheetCoordinateSystem(p.bounds,p.xdensity,p.ydensity).shape
@@ -281,6 +292,11 @@ class RandomDotStereogram(PatternGenerator):
 
         result = p.offset + p.scale*bigimage[ (ysize/2)+ydisparity:(3*ysize/2)+ydisparity ,
                                               (xsize/2)+xdisparity:(3*xsize/2)+xdisparity ]
+        if out is not None:
+            out[...] = result
+            result = out
+        else:
+            result = self._as_dtype(result,p.dtype)
 
         for of in p.output_fns:
             of(result)
@@ -28,6 +28,11 @@ class TransferFn(param.Parameterized):
     # term for it, general to output functions?  JAB: Please do rename it!
     norm_value = param.Parameter(default=None)
 
+    # Whether the function transforms each element independently of
+    # the others, so that it can be applied to parts of an array one
+    # at a time (e.g. by PatternGenerator.render_to_memmap)
+    _pointwise = False
+
     def initialize(self,  **kwargs):
         """
         Transfer functions may need additional information before the
@@ -130,6 +135,8 @@ class IdentityTF(TransferFn):
     behavior, add side effects, or anything of that nature.
     """
 
+    _pointwise = True
+
     def __call__(self,x,sum=None):
         pass
 
@@ -142,6 +149,8 @@ class Scale(TransferFn):
     scale = param.Number(default=1.0, doc="""
          The multiplicative factor that scales the input values.""")
 
+    _pointwise = True
+
     def __call__(self, x):
         x *= self.scale
 
@@ -155,6 +164,8 @@ class Threshold(TransferFn):
     threshold = param.Number(default=0.25, doc="""
         Decision point for determining values to clip.""")
 
+    _pointwise = True
+
     def __call__(self,x):
         numpy.minimum(x,self.threshold,x)
 
@@ -168,6 +179,8 @@ class BinaryThreshold(TransferFn):
     threshold = param.Number(default=0.25, doc="""
         Decision point for determining binary value.""")
 
+    _pointwise = True
+
     def __call__(self,x):
         above_threshold = x>=self.threshold
         x *= 0.0
@@ -195,6 +208,14 @@ class DivisiveNormalizeL1(TransferFn):
             factor = (self.norm_value/current_sum)
             x *= factor
 
+    def _partial_norm(self,x):
+        """Return the contribution of the part x of an array to its norm."""
+        return 1.0*numpy.sum(abs(x))
+
+    def _combined_norm(self,parts):
+        """Return the norm of an array from those of its parts."""
+        return sum(parts)
+
 
 
 class DivisiveNormalizeL2(TransferFn):
@@ -213,6 +234,14 @@ class DivisiveNormalizeL2(TransferFn):
             factor = (self.norm_value/tot)
             x *= factor
 
+    def _partial_norm(self,x):
+        """Return the contribution of the part x of an array to its norm."""
+        return 1.0*numpy.dot(x.ravel(),x.ravel())
+
+    def _combined_norm(self,parts):
+        """Return the norm of an array from those of its parts."""
+        return numpy.sqrt(sum(parts))
+
 
 
 class DivisiveNormalizeLinf(TransferFn):
@@ -235,6 +264,14 @@ class DivisiveNormalizeLinf(TransferFn):
             factor = (self.norm_value/tot)
             x *= factor
 
+    def _partial_norm(self,x):
+        """Return the contribution of the part x of an array to its norm."""
+        return 1.0*numpy.abs(x).max()
+
+    def _combined_norm(self,parts):
+        """Return the norm of an array from those of its parts."""
+        return max(parts)
+
 
 
 def norm(v,p=2):
@@ -264,6 +301,14 @@ class DivisiveNormalizeLp(TransferFn):
             factor = (self.norm_value/tot)
             x *=factor
 
+    def _partial_norm(self,x):
+        """Return the contribution of the part x of an array to its norm."""
+        return 1.0*(numpy.abs(x)**self.p).sum()
+
+    def _combined_norm(self,parts):
+        """Return the norm of an array from those of its parts."""
+        return sum(parts)**(1.0/self.p)
+
 
 class Hysteresis(TransferFnWithState):
     """
@@ -63,5 +63,12 @@ class LineTest(unittest.TestCase):
     def test_minimal_line_thickness_density20_x2(self):
         c = {'radius':5,  'density': 20,  'x': 2.}; self.minimal_line_thickness(c)
 
+    def test_minimal_line_thickness_region(self):
+        """Part of a line is drawn as in the whole line, with the same offset."""
+        line = imagen.Line(enforce_minimal_thickness=True,thickness=0.0,smoothing=0.0,
+                           orientation=0.3,xdensity=40,ydensity=40)
+        region = (slice(7,30),slice(3,20))
+        self.assertTrue((line()[region] == line.render_region(region)).all())
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,18 +6,24 @@ Original written as a unit test as part of the Topographica project.
 """
 
 import os
+import shutil
+import tempfile
 import unittest
+from multiprocessing.pool import ThreadPool
 
 
 cwd = os.path.abspath(os.path.split(__file__)[0])
 
 import param
 import numpy as np
-from numpy.testing import assert_array_equal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 from holoviews.core.boundingregion import BoundingBox
 from imagen import Constant,PatternGenerator
-from imagen import Rectangle,Gaussian,Composite,Selector
+from imagen import Rectangle,RawRectangle,Gaussian,Disk,Ring,Composite,Selector,SineGrating,Sweeper
+from imagen.patterngenerator import ArrayCache, coordinate_cache, result_cache
+from imagen.transferfn import DivisiveNormalizeL1, DivisiveNormalizeL2, DivisiveNormalizeLinf, Hysteresis, Scale, Threshold
 import numbergen
+import imagen
 
 
 
@@ -203,6 +209,522 @@ class TestPatternGenerator(unittest.TestCase):
 
     # Should also test rotating, resizing...
 
+    def test_coordinate_cache(self):
+        """
+        Coordinate grids are reused for repeated calls with the same
+        geometry, and are handed out read-only.
+        """
+        cache = coordinate_cache
+        cache.clear()
+        g = Gaussian(bounds=BoundingBox(radius=0.5),xdensity=8,ydensity=8)
+        first = g(x=0.1,orientation=0.3)
+        self.assertEqual((cache.hits,cache.misses),(0,1))
+        assert_array_equal(g(x=0.1,orientation=0.3),first)
+        self.assertEqual((cache.hits,cache.misses),(1,1))
+        g(x=0.2,orientation=0.3)
+        self.assertEqual((cache.hits,cache.misses),(1,2))
+        pattern_x,pattern_y = g._setup_xy(g.bounds,8,8,0.2,0.0,0.3)
+        self.assertEqual((cache.hits,cache.misses),(2,2))
+        self.assertFalse(pattern_x.flags.writeable)
+        self.assertTrue(first.flags.writeable)
+
+    def test_polar_coordinates(self):
+        """
+        Patterns drawn in polar coordinates share the radius and angle
+        computed for the same grid, including the parts of gratings.
+        """
+        cache = coordinate_cache
+        cache.clear()
+        params = dict(bounds=BoundingBox(radius=0.5),xdensity=9,ydensity=9,x=0.1,orientation=0.3)
+        Disk(**dict(params,orientation=0.0))()
+        misses = cache.misses
+        Ring(**dict(params,orientation=0.0))()
+        imagen.Wedge(**dict(params,orientation=0.0))()
+        self.assertEqual(cache.misses,misses+1)
+
+        parts = 5
+        wedges = [imagen.Wedge(size=1.0/parts,smoothing=0.8/parts,orientation=i*2*np.pi/parts)
+                  for i in range(parts)]
+        # Centred on the origin whatever x and y, as when it was drawn
+        # by a Composite of Wedges
+        assert_array_almost_equal(imagen.RadialGrating(parts=parts,y=-0.2,**params)(),
+                                  Composite(generators=wedges,**dict(params,x=0.0))())
+
+    def test_rotationally_symmetric(self):
+        """
+        Circular patterns are drawn on the unrotated grid, which is
+        then reused when only the orientation changes.
+        """
+        cache = coordinate_cache
+        cache.clear()
+        params = dict(bounds=BoundingBox(radius=0.5),xdensity=9,ydensity=9,x=0.1,aspect_ratio=1.0)
+        for pg in [Disk(**params),imagen.Ring(**params),imagen.ConcentricRings(**params),Gaussian(**params)]:
+            upright = pg(orientation=0.0)
+            misses = cache.misses
+            for orientation in [0.3,1.2,np.pi]:
+                assert_array_almost_equal(pg(orientation=orientation),upright)
+            self.assertEqual(cache.misses,misses)
+
+        ellipse = Disk(**dict(params,aspect_ratio=2.0))
+        self.assertFalse(np.allclose(ellipse(orientation=0.3),ellipse(orientation=0.0)))
+
+    def test_child_generators(self):
+        """
+        Patterns drawn by other generators keep them between calls,
+        creating new ones only when the structure of the pattern changes.
+        """
+        g = imagen.Asterisk(xdensity=11,ydensity=11)
+        g(size=0.6)
+        children = g._advance_pattern_generators(param.ParamOverrides(g,{}))
+        assert_array_equal(g(thickness=0.1),imagen.Asterisk(thickness=0.1,xdensity=11,ydensity=11)())
+        self.assertTrue(g._advance_pattern_generators(param.ParamOverrides(g,{})) is children)
+        assert_array_equal(g(parts=5),imagen.Asterisk(parts=5,xdensity=11,ydensity=11)())
+        self.assertEqual(len(g._advance_pattern_generators(param.ParamOverrides(g,{'parts':5}))),5)
+
+        for pg in [imagen.DifferenceOfGaussians(),imagen.OrientationContrast()]:
+            first = pg(xdensity=11,ydensity=11,orientation=0.3)
+            assert_array_equal(pg(xdensity=11,ydensity=11,orientation=0.3),first)
+            assert_array_equal(type(pg)()(xdensity=11,ydensity=11,orientation=0.6),
+                               pg(xdensity=11,ydensity=11,orientation=0.6))
+
+    def test_part_positions(self):
+        """
+        Asterisk and Angle match the Composites of Rectangles that
+        define them, centred on the origin whatever x and y.
+        """
+        params = dict(xdensity=13,ydensity=11,bounds=BoundingBox(radius=0.3),orientation=0.4)
+        size,thickness,smoothing,parts = 0.5,0.05,0.015,3
+        o = 2*np.pi/parts
+        rectangles = [Rectangle(orientation=i*o,smoothing=smoothing,aspect_ratio=2*thickness/size,
+                                size=size/2,x=-size/4*np.sin(i*o),y=size/4*np.cos(i*o))
+                      for i in range(parts)]
+        assert_array_almost_equal(imagen.Asterisk(x=0.1,y=-0.05,**params)(),
+                                  Composite(generators=rectangles,**params)())
+
+        angle = np.pi/4
+        rectangles = [Rectangle(orientation=i*angle,smoothing=smoothing,aspect_ratio=thickness/size,
+                                size=size,x=-size/2*np.sin(i*angle))
+                      for i in [-1,1]]
+        assert_array_almost_equal(imagen.Angle(x=0.1,y=-0.05,**params)(),
+                                  Composite(generators=rectangles,**params)())
+
+    def test_difference_of_gaussians(self):
+        """
+        DifferenceOfGaussians and SigmoidedDoG match the compositions
+        of L1-normalized Gaussians (and a Sigmoid) that define them.
+        """
+        params = dict(xdensity=13,ydensity=11,bounds=BoundingBox(radius=0.3))
+        for orientation in [0.0,0.5,np.pi/2]:
+            dog = imagen.DifferenceOfGaussians(orientation=orientation,x=0.05,positive_x=0.02,
+                                               positive_aspect_ratio=1.0,negative_y=-0.03)
+            gaussians = [Gaussian(x=0.07,size=0.1,aspect_ratio=1.0,orientation=orientation,
+                                  output_fns=[DivisiveNormalizeL1()]),
+                         Gaussian(x=0.05,y=-0.03,size=0.3,aspect_ratio=1.5,orientation=orientation,
+                                  output_fns=[DivisiveNormalizeL1()])]
+            assert_array_almost_equal(dog(**params),
+                                      Composite(generators=gaussians,operator=np.subtract)(**params),15)
+
+            sdog = imagen.SigmoidedDoG(orientation=orientation,x=0.05,y=0.02,sigmoid_position=0.04)
+            dog = imagen.DifferenceOfGaussians(positive_x=0.05,positive_y=0.02,negative_x=0.05,negative_y=0.02,
+                                               positive_size=0.075,positive_aspect_ratio=2.0,
+                                               negative_size=0.125,negative_aspect_ratio=1.0)
+            sigmoid = imagen.Sigmoid(slope=10.0,orientation=orientation+np.pi/2,x=0.09)
+            assert_array_almost_equal(sdog(**params),
+                                      Composite(generators=[dog,sigmoid],operator=np.multiply)(**params),15)
+
+    def test_coordinate_cache_bounded(self):
+        cache = ArrayCache(max_bytes=3*2*8*8*8)
+        create = lambda: (np.zeros((8,8)),np.zeros((8,8)))
+        for key in range(5):
+            cache.lookup(key,create)
+        self.assertEqual(len(cache),3)
+        self.assertTrue(cache.nbytes <= cache.max_bytes)
+        cache.lookup(2,create)
+        self.assertEqual(cache.hits,1)
+        cache.lookup(0,create)
+        self.assertEqual(cache.misses,6)
+
+    def test_memoize(self):
+        """
+        Memoized patterns are shared while the resolved parameters are
+        unchanged, but never for values drawn at random.
+        """
+        g = Gaussian(memoize=True,orientation=0.4,xdensity=10,ydensity=10)
+        pattern = g()
+        self.assertTrue(g() is pattern)
+        self.assertFalse(pattern.flags.writeable)
+        assert_array_equal(pattern,Gaussian(orientation=0.4,xdensity=10,ydensity=10)())
+        self.assertFalse(g(x=0.1) is pattern)
+        mask = np.ones((10,10))
+        self.assertTrue(g(mask=mask) is g(mask=mask.copy()))
+        self.assertFalse(g(mask=mask) is g(mask=mask*0.5))
+        g.x = numbergen.UniformRandom(seed=1)
+        self.assertFalse(g() is g())
+
+        # Output functions with state are applied on every call
+        g = Gaussian(memoize=True,output_fns=[Hysteresis(time_constant=0.5)],xdensity=10,ydensity=10)
+        first = g()
+        assert_array_almost_equal(g(),first*1.5)
+
+        # Generators using a memoized pattern modify only their own copy
+        g = Gaussian(memoize=True,orientation=0.4)
+        pattern = g(xdensity=10,ydensity=10)
+        for pg in [Selector(generators=[g],offset=0.1),
+                   Selector(generators=[g],mask=mask*0.5),
+                   Sweeper(generator=g,offset=0.1),
+                   Composite(generators=[g,Disk()],operator=np.add,scale=2.0)]:
+            result = pg(xdensity=10,ydensity=10)
+            self.assertTrue(result.flags.writeable)
+            assert_array_equal(g(xdensity=10,ydensity=10),pattern)
+        result_cache.clear()
+
+    def test_render_batch(self):
+        """
+        Each frame of a batch matches the corresponding individual call,
+        whether the batch is broadcast or rendered frame by frame.
+        """
+        bbox = BoundingBox(radius=0.5)
+        x = np.linspace(-0.3,0.3,4)
+        orientation = np.linspace(0,np.pi,4)
+        for pg in [SineGrating(bounds=bbox,xdensity=9,ydensity=9),
+                   Composite(generators=[Gaussian(),Rectangle()],bounds=bbox,xdensity=9,ydensity=9)]:
+            batch = pg.render_batch(x=x,orientation=orientation,scale=2.0)
+            self.assertEqual(batch.shape,(4,9,9))
+            for i in range(4):
+                assert_array_equal(batch[i],pg(x=x[i],orientation=orientation[i],scale=2.0))
+
+        # Parameters of the shape functions varied across the batch
+        values = dict(size=[0.2,0.4,0.6,0.8],thickness=[0.02,0.05,0.1,0.2],
+                      aspect_ratio=[0.5,1.0,1.5,2.0],frequency=[1.0,2.0,3.0,4.0],
+                      phase=[0.0,1.0,2.0,3.0])
+        for cls in [Disk,Ring,Rectangle,imagen.Gabor]:
+            pg = cls(bounds=bbox,xdensity=9,ydensity=9)
+            for name in cls._batch_params:
+                batch = pg.render_batch(**{name:values[name]})
+                for i in range(4):
+                    assert_array_almost_equal(batch[i],pg(**{name:values[name][i]}))
+
+        # Reimplements __call__, so cannot use SineGrating's function()
+        pg = imagen.OrientationContrast(bounds=bbox,xdensity=9,ydensity=9)
+        phase = np.linspace(0,np.pi,4)
+        batch = pg.render_batch(phase=phase)
+        for i in range(4):
+            assert_array_equal(batch[i],pg(phase=phase[i]))
+
+        self.assertRaises(ValueError,Gaussian().render_batch,x=[0.1,0.2],y=[0.3])
+
+    def test_out(self):
+        """Patterns rendered into a supplied buffer match newly allocated ones."""
+        bbox = BoundingBox(radius=0.5)
+        for pg in [Gaussian(scale=2.0,offset=0.5),
+                   Constant(scale=0.3),
+                   Composite(generators=[Gaussian(),Rectangle()],operator=np.add),
+                   Composite(generators=[Gaussian(),Rectangle()],operator=np.maximum,scale=0.5)]:
+            out = np.empty((9,9))
+            result = pg(out=out,bounds=bbox,xdensity=9,ydensity=9)
+            self.assertTrue(result is out)
+            assert_array_equal(out,pg(bounds=bbox,xdensity=9,ydensity=9))
+
+        # Output functions apply to the supplied buffer, whatever its type
+        out = np.empty((9,9),np.float32)
+        pg = Gaussian(output_fns=[DivisiveNormalizeL1()],scale=2.0,offset=0.5)
+        self.assertTrue(pg(out=out,bounds=bbox,xdensity=9,ydensity=9) is out)
+        self.assertAlmostEqual(out.sum(),1.0,places=5)
+
+    def test_shared_child_pattern(self):
+        """
+        Patterns that children return but may still be using (e.g.
+        cached images) are not modified by the generators combining them.
+        """
+        class Cached(PatternGenerator):
+            def __call__(self,out=None,**params_to_override):
+                return self.pattern
+
+        kw = dict(bounds=BoundingBox(radius=0.5),xdensity=9,ydensity=9)
+        cached = Cached()
+        cached.pattern = Gaussian(**kw)()
+        original = cached.pattern.copy()
+        for pg in [Composite(generators=[cached,Gaussian()],operator=np.add),
+                   Selector(generators=[cached],scale=2.0),
+                   Selector(generators=[cached],offset=0.1,mask=np.ones((9,9)))]:
+            first = pg(**kw)
+            assert_array_equal(pg(**kw),first)
+            assert_array_equal(cached.pattern,original)
+
+    def test_dtype(self):
+        """Single-precision patterns are computed and returned as float32."""
+        bbox = BoundingBox(radius=0.5)
+        for pg in [Gaussian(orientation=0.3,scale=2.0,offset=0.5),
+                   Constant(scale=0.3),
+                   Rectangle(mask_shape=Gaussian()),
+                   Composite(generators=[Gaussian(),Rectangle()],operator=np.add)]:
+            single = pg(bounds=bbox,xdensity=9,ydensity=9,dtype=np.float32)
+            self.assertEqual(single.dtype,np.float32)
+            double = pg(bounds=bbox,xdensity=9,ydensity=9)
+            self.assertEqual(double.dtype,np.float64)
+            assert_array_almost_equal(single,double,decimal=6)
+
+        # The coordinate grids are computed in single precision too,
+        # including at other than multiples of pi/2 and for children
+        # of a Composite, which are positioned with float64 values
+        grids = []
+        class Recorded(Gaussian):
+            def function(self,p):
+                grids.extend([p.pattern_x,p.pattern_y])
+                return super(Recorded,self).function(p)
+        Recorded(orientation=0.3)(bounds=bbox,xdensity=9,ydensity=9,dtype=np.float32)
+        Composite(generators=[Recorded(x=0.1,orientation=0.2)],x=0.05,orientation=0.3)(
+            bounds=bbox,xdensity=9,ydensity=9,dtype=np.float32)
+        self.assertEqual(len(grids),4)
+        for grid in grids:
+            self.assertEqual(grid.dtype,np.float32)
+
+    def test_separable(self):
+        """Axis-aligned separable patterns match those drawn on full coordinate matrices."""
+        bbox = BoundingBox(points=((-0.5,-0.3),(0.5,0.3)))
+        for cls in [Gaussian,Rectangle,RawRectangle]:
+            for orientation in [0,np.pi/2,np.pi,3*np.pi/2]:
+                pg = cls(size=0.4,aspect_ratio=1.7,x=0.13,y=-0.07,orientation=orientation,
+                         bounds=bbox,xdensity=10,ydensity=10)
+                result = pg()
+                pattern_x,pattern_y = pg._setup_xy(bbox,10,10,0.13,-0.07,orientation)
+                self.assertEqual(min(pattern_x.shape),1)
+                pg._separable = False
+                assert_array_almost_equal(result,pg(),decimal=14)
+
+    def test_composite_support(self):
+        """Components rendered within their support match full renderings."""
+        bbox = BoundingBox(radius=0.5)
+        gens = [Gaussian(size=0.005,x=0.3,y=0.2),
+                Disk(size=0.02,smoothing=0.002,x=-0.2,y=0.1,orientation=0.4),
+                Rectangle(size=0.02,smoothing=0.001,x=0.49,y=-0.3,orientation=1.0,scale=-1.0),
+                Ring(size=0.03,smoothing=0.001,x=-0.4,y=-0.45)]
+        for operator in [np.add,np.maximum,np.multiply]:
+            c = Composite(generators=gens,operator=operator,bounds=bbox,xdensity=80,ydensity=80)
+            target = operator.reduce([g(bounds=bbox,xdensity=80,ydensity=80) for g in gens])
+            assert_array_equal(c(),target)
+
+    def test_expression_flattening(self):
+        """
+        Chained operators are rendered as a single Composite with the
+        same result, including after changes to the nested Composites.
+        """
+        g,r,d,s = Gaussian(),Rectangle(),Disk(x=0.2),SineGrating()
+        kw = dict(bounds=BoundingBox(radius=0.5),xdensity=20,ydensity=20)
+        flattened = lambda c: Composite._flattened(c.operator,c.generators)
+        self.assertEqual(len(flattened(g+r+d+s)),4)
+        self.assertEqual(len(flattened((g|r)|(d|s))),4)
+        self.assertEqual(len(flattened(g-(r-d))),2)
+        self.assertEqual(len(flattened(Composite(generators=[g,r],operator=np.add,scale=2.0)+d)),2)
+        assert_array_equal((g+r-d*s)(**kw),
+                           (g(**kw)+r(**kw))-d(**kw)*s(**kw))
+
+        inner = g+r
+        outer = inner+d
+        inner.generators = [g,s]
+        assert_array_equal(outer(**kw),(g(**kw)+s(**kw))+d(**kw))
+        inner.operator = np.maximum
+        assert_array_equal(outer(**kw),np.maximum(g(**kw),s(**kw))+d(**kw))
+
+    def test_composite_dtype(self):
+        """Non-floating-point patterns are combined as by operator.reduce."""
+        kw = dict(bounds=BoundingBox(radius=0.5),xdensity=10,ydensity=10)
+        gens = [RawRectangle(size=0.4),RawRectangle(size=0.2),Gaussian()]
+        for operator,n in [(np.add,2),(np.add,3),(np.multiply,2),(np.maximum,2),(np.subtract,3)]:
+            result = Composite(generators=gens[:n],operator=operator)(**kw)
+            target = operator.reduce([g(**kw) for g in gens[:n]])
+            self.assertEqual(result.dtype,target.dtype)
+            assert_array_almost_equal(result,target)
+
+    def test_constant_folding(self):
+        """Constants combined as scalars give the same result as uniform arrays."""
+        g = Gaussian(aspect_ratio=0.5)
+        kw = dict(bounds=BoundingBox(radius=0.5),xdensity=20,ydensity=20)
+        pattern = g(**kw)
+        assert_array_equal((g*2+0.5)(**kw),pattern*2+0.5)
+        assert_array_equal((2-g)(**kw),2-pattern)
+        assert_array_equal((-g)(**kw),0.0-pattern)
+        assert_array_equal((Constant(scale=0.3)+Constant(scale=0.2))(**kw),np.ones((20,20))*0.5)
+        for dtype in [np.float32,np.float64]:
+            for orientation in [0.0,0.3]:
+                single = (g*3-1)(dtype=dtype,orientation=orientation,**kw)
+                self.assertEqual(single.dtype,dtype)
+                assert_array_equal(single,g(dtype=dtype,orientation=orientation,**kw)*dtype(3)-dtype(1))
+
+    def test_anim_workers(self):
+        """Frames rendered in worker processes match those rendered serially."""
+        sweeper = Sweeper(generator=SineGrating(),speed=0.1,xdensity=12,ydensity=12)
+        serial = sweeper.anim(6,offset=1)
+        parallel = sweeper.anim(6,offset=1,workers=3)
+        self.assertEqual(serial.keys(),parallel.keys())
+        for key in serial.keys():
+            assert_array_equal(serial[key].data,parallel[key].data)
+
+    def test_iter_frames(self):
+        """iter_frames yields the frames of anim, optionally into one buffer."""
+        sweeper = Sweeper(generator=SineGrating(),speed=0.1,xdensity=12,ydensity=12)
+        anim = sweeper.anim(4,offset=1)
+        frames = list(sweeper.iter_frames(4,offset=1,with_time=True))
+        self.assertEqual([time for time,_ in frames],list(anim.keys()))
+        buffer = np.empty((12,12))
+        for (time,frame),pattern in zip(frames,sweeper.iter_frames(4,offset=1,out=buffer)):
+            self.assertTrue(pattern is buffer)
+            assert_array_equal(frame,anim[time].data)
+            assert_array_equal(pattern,frame)
+
+        # Generators that reimplement __call__ without out are copied
+        class Called(Gaussian):
+            def __call__(self):
+                return Gaussian.__call__(self,xdensity=12,ydensity=12)
+        frames = list(Called().iter_frames(2))
+        self.assertEqual(len(frames),3)
+        buffer.fill(0)
+        for pattern in Called().iter_frames(2,out=buffer):
+            self.assertTrue(pattern is buffer)
+            assert_array_equal(pattern,frames[0])
+
+    def test_profile(self):
+        """Profiling records a tree of generators and stages, and leaves the patterns unchanged."""
+        g = Gaussian(name='g')
+        d = Disk(name='d',mask_shape=Rectangle(name='r'))
+        pattern = Composite(name='c',generators=[g,d],xdensity=10,ydensity=10)
+        expected = pattern()
+        call = Composite.__call__
+        with imagen.profile(report_on_exit=False) as prof:
+            assert_array_equal(pattern(),expected)
+        self.assertTrue(Composite.__call__ is call)
+        c,g,d,r = 'c (Composite)','g (Gaussian)','d (Disk)','r (Rectangle)'
+        self.assertEqual(prof.records[(c,)][0],1)
+        self.assertTrue((c,'function',g,'coordinates') in prof.records)
+        self.assertTrue((c,'function',d,'mask',r,'function') in prof.records)
+        self.assertTrue('scale/offset' in prof.report())
+
+        # The peak memory includes temporaries freed before returning,
+        # and is attributed to the callers too
+        class Temporary(Gaussian):
+            def function(self,p):
+                np.ones(10**6)
+                return super(Temporary,self).function(p)
+        pattern = Composite(name='c',generators=[Temporary(name='t'),Disk()])
+        with imagen.profile(report_on_exit=False) as prof:
+            pattern(xdensity=10,ydensity=10)
+        if prof._memory:
+            t = 't (Temporary)'
+            for path in [(c,),(c,'function'),(c,'function',t),(c,'function',t,'function')]:
+                self.assertTrue(prof.records[path][2] >= 8*10**6)
+            self.assertTrue(prof.records[(c,'function',t,'coordinates')][2] < 10**6)
+
+    def test_compile(self):
+        """A compiled pattern renders as the generator does with the same parameters."""
+        g = Gaussian(aspect_ratio=0.5,size=0.3)
+        compiled = g.compile(xdensity=16,ydensity=16)
+        for x,orientation in [(0.0,0.0),(0.1,0.7),(-0.2,np.pi/2)]:
+            assert_array_equal(compiled(x=x,orientation=orientation),
+                               g(x=x,orientation=orientation,xdensity=16,ydensity=16))
+        out = np.empty((16,16))
+        self.assertTrue(compiled(out=out,y=0.1) is out)
+        assert_array_equal(out,g(y=0.1,xdensity=16,ydensity=16))
+        self.assertRaises(TypeError,compiled,wavelength=2)
+        dynamic = Gaussian(x=numbergen.UniformRandom(seed=1)).compile()
+        assert_array_equal(dynamic(),dynamic())
+
+    def test_render_region(self):
+        """A rendered region matches the same window of the full pattern."""
+        g = Gaussian(aspect_ratio=0.5,size=0.3,orientation=0.7,x=0.1)
+        d = Disk(size=0.4,smoothing=0.05)
+        mask = Disk(size=0.7,smoothing=0.1)(xdensity=20,ydensity=20)
+        window = (slice(3,12),slice(5,17))
+        for pg in [g, Composite(generators=[g,Rectangle(size=0.2)],mask_shape=d),
+                   g*d-g, Gaussian(mask=mask), Selector(generators=[g,d],index=0.5),
+                   Gaussian(output_fns=[DivisiveNormalizeL1()])]:
+            full = pg(xdensity=20,ydensity=20)
+            assert_array_equal(pg.render_region(window,xdensity=20,ydensity=20),full[window])
+
+        bbox = BoundingBox(points=((-0.2,-0.1),(0.3,0.25)))
+        full = g(xdensity=20,ydensity=20)
+        region = g.render_region(bbox,xdensity=20,ydensity=20)
+        assert_array_equal(region,full[5:12,6:16])
+
+        out = np.empty((9,12))
+        self.assertTrue(g.render_region(window,out=out,xdensity=20,ydensity=20) is out)
+        assert_array_equal(out,full[window])
+
+        self.assertRaises(ValueError,g.render_region,(slice(0,10,2),slice(None)),xdensity=20,ydensity=20)
+
+    def test_threads(self):
+        """A pattern rendered by several threads matches one rendered by a single thread."""
+        g = Gaussian(aspect_ratio=0.5,size=0.3,orientation=0.7,x=0.1)
+        d = Disk(size=0.4,smoothing=0.05)
+        for pg in [g, Composite(generators=[g,Rectangle(size=0.2)],mask_shape=d), g*d-g,
+                   Gaussian(output_fns=[DivisiveNormalizeL1()])]:
+            assert_array_equal(pg(xdensity=21,ydensity=21,threads=4),
+                               pg(xdensity=21,ydensity=21))
+        random = lambda: Gaussian(x=numbergen.UniformRandom(seed=1))
+        assert_array_equal(random()(xdensity=21,ydensity=21,threads=4),
+                           random()(xdensity=21,ydensity=21))
+        out = np.empty((21,21))
+        self.assertTrue(g(out=out,xdensity=21,ydensity=21,threads=3) is out)
+        assert_array_equal(out,g(xdensity=21,ydensity=21))
+
+    def test_reentrant(self):
+        """One generator can render different patterns in several threads at once."""
+        g = Gaussian(aspect_ratio=0.5,size=0.3)
+        c = Composite(generators=[g,Disk(size=0.2,x=0.1)],mask_shape=Disk(size=0.8))
+        params = [dict(x=x,orientation=o,xdensity=31,ydensity=31)
+                  for x in np.linspace(-0.3,0.3,6) for o in [0.0,0.4,np.pi/2]]
+        pool = ThreadPool(4)
+        try:
+            for pg in [g,c]:
+                patterns = pool.map(lambda kw: pg(**kw),params*4)
+                for kw,pattern in zip(params*4,patterns):
+                    assert_array_equal(pattern,pg(**kw))
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_float_errors(self):
+        """Patterns with zero smoothing are zero outside their shapes, without floating-point errors."""
+        with np.errstate(divide='raise',invalid='raise'):
+            for pg in [Disk(smoothing=0.0),Ring(smoothing=0.0),Rectangle(smoothing=0.0),
+                       imagen.Line(smoothing=0.0),imagen.HalfPlane(smoothing=0.0),
+                       imagen.SpiralGrating(smoothing=0.0),imagen.Wedge(smoothing=0.0)]:
+                settings = np.geterr()
+                pattern = pg(xdensity=9,ydensity=9)
+                self.assertEqual(np.geterr(),settings)
+                self.assertTrue(set(np.unique(pattern)) <= set([0.0,1.0]))
+
+    def test_patternfn_out(self):
+        """Shape functions writing into out= return it, holding the same values."""
+        from imagen import patternfn
+        x,y = np.meshgrid(np.linspace(-0.5,0.5,11),np.linspace(-0.5,0.5,9))
+        for fn,args in [(patternfn.gaussian,(x,y,0.3,0.2)),
+                        (patternfn.gabor,(x,y,0.3,0.2,2.0,0.5)),
+                        (patternfn.line,(y,0.2,0.1)),
+                        (patternfn.disk,(x,y,0.5,0.1)),
+                        (patternfn.ring,(x,y,0.5,0.1,0.1)),
+                        (patternfn.smooth_rectangle,(x,y,0.4,0.3,0.1,0.05))]:
+            out = np.empty(x.shape)
+            self.assertTrue(fn(*args,out=out) is out)
+            assert_array_equal(out,fn(*args))
+
+    def test_render_to_memmap(self):
+        """A pattern rendered to a file one tile at a time matches one rendered whole."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree,directory)
+        path = os.path.join(directory,'pattern.npy')
+        g = Gaussian(aspect_ratio=0.5,size=0.3,orientation=0.7)
+        for pg in [g, Composite(generators=[g,Rectangle(size=0.2)],mask_shape=Disk(size=0.4)),
+                   Gaussian(output_fns=[DivisiveNormalizeL1()]),
+                   Gaussian(output_fns=[Scale(scale=2),DivisiveNormalizeL2(),
+                                        DivisiveNormalizeLinf(),Threshold(threshold=0.5)])]:
+            pattern = pg.render_to_memmap(path,tile=(7,5),xdensity=23,ydensity=23)
+            assert_array_almost_equal(pattern,pg(xdensity=23,ydensity=23))
+            assert_array_almost_equal(np.load(path),pattern)
+
+        class Unknown(Scale):
+            _pointwise = False
+        self.assertRaises(ValueError,Gaussian(output_fns=[Unknown()]).render_to_memmap,path)
+
     def test_bug__dynamic_param_advanced_by_repr(self):
         """Check for bug where repr of a PatternGenerator causes a DynamicNumber to change."""
         # CEB: can probably remove this test now we have time-controlled dynamic parameters